@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+'''Generate fake PBS status files for benchmarking
+
+Writes files in the format expected by the --debug fake_<stat>_<host>=file
+options of nas_qstat and nas_rstat (the same format as qstat -f and
+pbsnodes -av output), plus a resource group file and binary usage file
+for nas_pbsfs. The contents come from the simulated server in
+nas_ifl_sim, so are random, but repeatable for a given seed.
+'''
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import nas_ifl_sim as sim     # noqa: E402
+
+# Time the fake data are "as of". Pass it to nas_qstat as fake_time.
+NOW = 1700000000
+# Kinds of status files, as in --debug fake_<kind>_<host>=file
+STAT_KINDS = ['jobs', 'vnodes', 'server', 'resvs', 'queues']
+# First line of each item, before the id
+ID_PREFIX = {'jobs': 'Job Id: ', 'vnodes': '', 'server': 'Server: ',
+             'resvs': 'Resv ID: ', 'queues': 'Queue: '}
+# Attributes shown as epoch (date)
+TIME_ATTRS = {'ctime', 'etime', 'mtime', 'qtime', 'stime', 'obittime',
+              'estimated.start_time', 'Execution_Time', 'reserve_start',
+              'reserve_end'}
+
+
+def ctime_value(t, cache={}):
+    '''Format epoch time as qstat -f does: epoch (date)'''
+    v = cache.get(t)
+    if v is None:
+        v = cache[t] = '%s (%s)' % (t, time.strftime(
+            '%a %b %d %H:%M:%S %Y', time.gmtime(int(t))))
+    return v
+
+
+def write_items(fname, prefix, items):
+    '''Write list of status dicts to file, in qstat -f format'''
+    with open(fname, 'w') as fd:
+        chunk = []
+        for item in items:
+            chunk.append(prefix + item['id'])
+            for (key, value) in item.items():
+                if key == 'id':
+                    continue
+                if key in TIME_ATTRS:
+                    value = ctime_value(value)
+                chunk.append('    %s = %s' % (key, value))
+            chunk.append('')
+            if len(chunk) > 50000:
+                fd.write('\n'.join(chunk))
+                fd.write('\n')
+                chunk = []
+        if chunk:
+            fd.write('\n'.join(chunk))
+            fd.write('\n')
+
+
+def write_fairshare(cl, groups_file, usage_file):
+    '''Write resource_group and usage files for nas_pbsfs
+
+    Args:
+        cl = nas_ifl_sim.Cluster with the users and groups
+        groups_file = path for resource_group file
+        usage_file = path for usage file
+    '''
+    lines = ['# Generated by gen_fake.py']
+    for (name, sbus) in sim.MODELS:
+        lines.append('#model %s %d %.1f' % (name, sim.CPUS_PER_NODE, sbus))
+    usage = []
+    gid = 10
+    for g in range(cl.ngroups):
+        gname = cl.group(g)
+        lines.append('%s %d root %d' % (gname, gid, cl.rng.randint(1, 100)))
+        gid += 1
+        usage.append((gname, cl.rng.uniform(0, 1e6)))
+        lines.append('#map %s:.* %s' % (gname, gname))
+    with open(groups_file, 'w') as fd:
+        fd.write('\n'.join(lines) + '\n')
+    with open(usage_file, 'wb') as fd:
+        fd.write(struct.pack('9sdl', b'PBS_MAG!', 2.0, NOW))
+        for (name, use) in usage:
+            fd.write(struct.pack('50sd', name.encode('utf-8'), use))
+
+
+def file_paths(out, server):
+    '''Get paths of the files generate() writes
+
+    Args:
+        out = directory the files are in
+        server = server name
+    Returns:
+        dict mapping file kind (jobs, vnodes, server, resvs, queues,
+        groups, usage) to path
+    '''
+    sname = server.split('.')[0]
+    paths = dict()
+    for kind in STAT_KINDS:
+        paths[kind] = os.path.join(out, 'fake_%s_%s' % (kind, sname))
+    paths['groups'] = os.path.join(out, 'resource_group')
+    paths['usage'] = os.path.join(out, 'usage')
+    return paths
+
+
+def generate(out, njobs, nvnodes, server, seed=1):
+    '''Write a full set of fake status files
+
+    Args:
+        out = directory to write to (created if needed)
+        njobs = number of jobs
+        nvnodes = number of vnodes
+        server = server name used in job and reservation ids
+        seed = random seed
+    Returns:
+        dict from file_paths()
+    '''
+    os.makedirs(out, exist_ok=True)
+    cl = sim.Cluster(njobs, nvnodes, server, seed, NOW)
+    paths = file_paths(out, server)
+    for kind in STAT_KINDS:
+        write_items(paths[kind], ID_PREFIX[kind],
+                    getattr(cl, kind + '_items')())
+    write_fairshare(cl, paths['groups'], paths['usage'])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=1000,
+                        help='number of jobs (default 1000)')
+    parser.add_argument('--vnodes', type=int, default=100,
+                        help='number of vnodes (default 100)')
+    parser.add_argument('--server', default='pbs1',
+                        help='server name for job ids (default pbs1)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='random seed (default 1)')
+    parser.add_argument('--out', default='.',
+                        help='directory to write files to')
+    args = parser.parse_args()
+    paths = generate(args.out, args.jobs, args.vnodes, args.server,
+                     args.seed)
+    for kind in sorted(paths):
+        print('%-7s %s' % (kind, paths[kind]))
+    print('Use with: --debug fake_time=%d' % NOW)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vi:ts=4:sw=4:expandtab
@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+
+'''Benchmark nas_qstat, nas_rstat, and nas_pbsfs on synthetic data
+
+Generates fake status files (see gen_fake.py) for one or more scales,
+runs a set of commands against them through the --debug fake_xxx
+options, so no PBS server is needed, and reports wall time, peak RSS,
+and (from an extra run with --debug profile, which does not trace
+memory) the time spent in each phase.
+
+The pbs_ifl module must still be importable (e.g., via PYTHONPATH),
+because the commands import it at startup, unless NAS_IFL_SIM is set
+to use the simulated one (see nas_ifl_sim.py).
+
+Results can be saved as a named baseline in bench/baselines, and later
+runs compared against it. A comparison exits 1 if any case got slower
+or bigger than the baseline by more than the threshold. Baselines are
+specific to the host they were saved on, so none are shipped: save one
+with --save on the host before comparing against it there.
+'''
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, bench_dir)
+import gen_fake     # noqa: E402
+
+# Name: (jobs, vnodes)
+SCALES = {
+    '1k': (1000, 100),
+    '10k': (10000, 1000),
+    '50k': (50000, 5000),
+    '200k': (200000, 10000),
+    '500k': (500000, 20000),
+}
+
+# Name: (command, arguments)
+CASES = [
+    ('qstat', ('nas_qstat', [])),
+    ('qstat_x_wide', ('nas_qstat', ['-x', '-W',
+                                    'o=+remwallt,lifetime,qtime,memory'])),
+    ('qstat_sort', ('nas_qstat', ['-W', 'sort=-cpus,user'])),
+    ('qstat_limit', ('nas_qstat', ['-W', 'sort=-eff', '-W', 'limit=50'])),
+    ('qstat_user', ('nas_qstat', ['-u', 'u00001'])),
+    ('qstat_nodes', ('nas_qstat', ['-n', '-s', '-1'])),
+    ('qstat_csv', ('nas_qstat', ['-W', 'format=csv'])),
+    ('qstat_f', ('nas_qstat', ['-f'])),
+    ('qstat_f_json', ('nas_qstat', ['-xf', '-F', 'json'])),
+    ('qstat_a', ('nas_qstat', ['-a'])),
+    ('qstat_a_detail', ('nas_qstat', ['-a', '-W', 'node_detail'])),
+    ('qstat_Q', ('nas_qstat', ['-Q'])),
+    ('qstat_B', ('nas_qstat', ['-B'])),
+    ('rstat', ('nas_rstat', [])),
+    ('rstat_f', ('nas_rstat', ['-f'])),
+    ('pbsfs', ('nas_pbsfs', [])),
+    ('pbsfs_convert', ('nas_pbsfs', ['-c'])),
+]
+
+
+def get_server():
+    '''Get the default server name from the PBS configuration'''
+    if os.environ.get('NAS_IFL_SIM'):
+        sys.path.insert(1, src_dir)
+        import nas_ifl_sim as ifl
+    else:
+        import pbs_ifl as ifl
+    if ifl.pbs_loadconf(0) == 0:
+        return None
+    return ifl.cvar.pbs_conf.pbs_server_name
+
+
+def make_data(data_dir, scale, server, seed):
+    '''Generate data for scale, unless already there
+
+    Returns:
+        dict of paths from gen_fake.file_paths()
+    '''
+    (njobs, nvnodes) = SCALES[scale]
+    out = os.path.join(data_dir, scale)
+    stamp = os.path.join(out, 'params')
+    params = '%d %d %s %d\n' % (njobs, nvnodes, server, seed)
+    try:
+        with open(stamp) as fd:
+            old = fd.read()
+    except OSError:
+        old = None
+    if old == params:
+        return gen_fake.file_paths(out, server)
+    t = time.perf_counter()
+    # Generate in a separate process. Linux counts the peak RSS of a
+    # process before it calls exec in the ru_maxrss of the new program,
+    # so this process must stay small for the RSS figures to mean much.
+    subprocess.run([sys.executable, gen_fake.__file__, '--jobs',
+                    str(njobs), '--vnodes', str(nvnodes), '--server', server,
+                    '--seed', str(seed), '--out', out],
+                   stdout=subprocess.DEVNULL, check=True)
+    with open(stamp, 'w') as fd:
+        fd.write(params)
+    print('Generated %s data in %.1fs' % (scale, time.perf_counter() - t),
+          file=sys.stderr)
+    return gen_fake.file_paths(out, server)
+
+
+def case_argv(cmd, args, paths, server, tmp_dir):
+    '''Build the command line for a case'''
+    argv = [sys.executable, os.path.join(src_dir, cmd)]
+    if cmd == 'nas_pbsfs':
+        argv += ['--groups', paths['groups']]
+        if '-c' in args:
+            argv += ['--job_file', paths['jobs'], '--new_usage',
+                     os.path.join(tmp_dir, 'new_usage')]
+        else:
+            argv += ['--usage', paths['usage']]
+        return argv + args
+    argv += ['--debug', 'fake_time=%d' % gen_fake.NOW]
+    # nas_qstat looks for the short server name, nas_rstat for the
+    # full name.
+    names = {server.split('.')[0], server}
+    for kind in gen_fake.STAT_KINDS:
+        for name in sorted(names):
+            argv += ['--debug', 'fake_%s_%s=%s' % (kind, name, paths[kind])]
+    return argv + args
+
+
+def run_once(argv, env):
+    '''Run a command, discarding its output
+
+    Returns:
+        (wall seconds, peak RSS in MB, stderr text)
+    '''
+    t = time.perf_counter()
+    with open(os.devnull, 'w') as null:
+        p = subprocess.Popen(argv, stdout=null, stderr=subprocess.PIPE,
+                             env=env)
+        err = p.stderr.read()
+        p.stderr.close()
+        (pid, status, ru) = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t
+    if p.returncode != 0:
+        raise RuntimeError('%s exited %d:\n%s' %
+                           (' '.join(argv), p.returncode,
+                            err.decode(errors='replace')))
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = ru.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return (wall, rss / 1e6, err)
+
+
+def run_case(argv, repeat, env):
+    '''Run a case several times, plus once with profiling
+
+    The profiled run uses plain --debug profile, not profile_mem, so
+    its phase times are those of an ordinary run.
+
+    Returns:
+        dict with best wall_ms, max rss_mb, and phases (name: ms)
+    '''
+    walls = []
+    rss = 0
+    for i in range(repeat):
+        (w, r, err) = run_once(argv, env)
+        walls.append(w)
+        rss = max(rss, r)
+    result = {'wall_ms': round(min(walls) * 1000, 1),
+              'rss_mb': round(rss, 1),
+              'phases': {}}
+    if os.path.basename(argv[1]) == 'nas_pbsfs':
+        return result
+    (w, r, err) = run_once(argv + ['--debug', 'profile=json'], env)
+    for line in err.decode(errors='replace').splitlines():
+        if line.startswith('{'):
+            rec = json.loads(line)
+            result['phases'] = dict((k, v['ms'])
+                                    for (k, v) in rec['phases'].items())
+    return result
+
+
+def compare(results, base, threshold):
+    '''Compare results with a baseline
+
+    Returns:
+        list of strings describing regressions
+    '''
+    bad = []
+    for (scale, cases) in results.items():
+        for (name, res) in cases.items():
+            old = base.get(scale, {}).get(name)
+            if old is None:
+                continue
+            for key in ('wall_ms', 'rss_mb'):
+                if res[key] > old[key] * (1.0 + threshold):
+                    bad.append('%s %s %s: %.1f -> %.1f (+%.0f%%)' %
+                               (scale, name, key, old[key], res[key],
+                                100.0 * (res[key] / old[key] - 1.0)))
+    return bad
+
+
+def print_results(results, base):
+    '''Print a table of results, with baseline values if available'''
+    fmt = '%-5s %-15s %9s %8s %8s %8s  %s'
+    print(fmt % ('scale', 'case', 'wall ms', 'base', 'RSS MB', 'base',
+                 'slowest phases'))
+    for (scale, cases) in results.items():
+        for (name, res) in cases.items():
+            old = base.get(scale, {}).get(name, {})
+            phases = sorted(res['phases'].items(), key=lambda x: -x[1])
+            ptext = ' '.join(['%s=%.0f' % x for x in phases[:3]])
+            print(fmt % (scale, name, '%.1f' % res['wall_ms'],
+                         '%.1f' % old['wall_ms'] if old else '--',
+                         '%.1f' % res['rss_mb'],
+                         '%.1f' % old['rss_mb'] if old else '--', ptext))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1k,10k',
+                        help='comma separated list of scales from %s'
+                        ' (default 1k,10k)' % ','.join(SCALES))
+    parser.add_argument('--cases', default='*',
+                        help='comma separated list of case name patterns'
+                        ' (default all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case; the fastest counts'
+                        ' (default 3)')
+    parser.add_argument('--data', default=os.path.join(
+                        os.environ.get('TMPDIR', '/tmp'), 'nas_bench'),
+                        help='directory for generated data')
+    parser.add_argument('--server', help='server name (default from'
+                        ' PBS configuration)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='random seed for data generation')
+    parser.add_argument('--save', metavar='NAME',
+                        help='save results as baseline NAME')
+    parser.add_argument('--compare', metavar='NAME',
+                        help='compare results with baseline NAME')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional increase counted as regression'
+                        ' (default 0.2)')
+    parser.add_argument('--list', action='store_true',
+                        help='list scales and cases, then exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for (name, (njobs, nvnodes)) in SCALES.items():
+            print('scale %-5s %7d jobs %6d vnodes' % (name, njobs, nvnodes))
+        for (name, (cmd, cargs)) in CASES:
+            print('case  %-15s %s %s' % (name, cmd, ' '.join(cargs)))
+        return 0
+    scales = args.scales.split(',')
+    for scale in scales:
+        if scale not in SCALES:
+            print('Unknown scale: %s' % scale, file=sys.stderr)
+            return 2
+    patts = args.cases.split(',')
+    cases = [x for x in CASES
+             if any([fnmatch.fnmatchcase(x[0], p) for p in patts])]
+    server = args.server or get_server()
+    if not server:
+        print('Cannot determine server name. Use --server.',
+              file=sys.stderr)
+        return 2
+    base = dict()
+    if args.compare:
+        fname = os.path.join(bench_dir, 'baselines', args.compare + '.json')
+        with open(fname) as fd:
+            base = json.load(fd)['results']
+    env = dict(os.environ)
+    env['TZ'] = 'UTC'
+    env['PYTHONHASHSEED'] = '0'
+
+    results = dict()
+    for scale in scales:
+        paths = make_data(args.data, scale, server, args.seed)
+        results[scale] = dict()
+        for (name, (cmd, cargs)) in cases:
+            argv = case_argv(cmd, cargs, paths, server,
+                             os.path.join(args.data, scale))
+            try:
+                results[scale][name] = run_case(argv, args.repeat, env)
+            except RuntimeError as e:
+                print('%s %s failed: %s' % (scale, name, e),
+                      file=sys.stderr)
+                return 2
+    print_results(results, base)
+
+    if args.save:
+        fname = os.path.join(bench_dir, 'baselines', args.save + '.json')
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        rec = {
+            'date': time.strftime('%Y-%m-%d'),
+            'python': platform.python_version(),
+            'machine': '%s %s, %d CPUs' % (platform.system(),
+                                           platform.machine(),
+                                           os.cpu_count()),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'results': results,
+        }
+        with open(fname, 'w') as fd:
+            json.dump(rec, fd, indent=1, sort_keys=True)
+            fd.write('\n')
+    if args.compare:
+        bad = compare(results, base, args.threshold)
+        for line in bad:
+            print('REGRESSION: ' + line)
+        if bad:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vi:ts=4:sw=4:expandtab
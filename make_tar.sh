@@ -12,9 +12,12 @@ chmod 755 .
 mkdir -p -m 755 bin lib lib/site man man/man1 man/man3 man/man8
 ln -s ../../nas_pbsfs bin/
 ln -s ../../nas_qstat bin/
+ln -s ../../nas_qstatd bin/
 ln -s ../../nas_rstat bin/
+ln -s ../../nas_colfmt.py lib/
 ln -s ../../nas_field_format.py lib/
 ln -s ../../nas_fsutil.py lib/
+ln -s ../../nas_ifl_sim.py lib/
 ln -s ../../nas_layout.py lib/
 ln -s ../../nas_pbsutil.py lib/
 ln -s ../../nas_xstat_config.py lib/
@@ -27,6 +30,7 @@ ln -s ../../../qstat_userexits lib/site/
 ln -s ../../../nas_qstat.1 man/man1/
 ln -s ../../../nas_qstat_userexits.3 man/man3/
 ln -s ../../../nas_pbsfs.8 man/man8/
+ln -s ../../../nas_qstatd.8 man/man8/
 
 tar -czf ../${1:-nas_qstat.tgz} --dereference --owner=0 --group=0 .
 
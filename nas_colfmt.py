@@ -0,0 +1,383 @@
+'''
+Column-at-a-time formatting of durations, sizes, and efficiencies.
+
+The functions in nas_field_format compute one field value for one job
+at a time. For big listings (e.g., nas_qstat -x or -t), the duration,
+size and efficiency columns account for much of the time spent
+formatting. The functions here compute a whole column at once:
+raw values are parsed once per distinct string, the arithmetic is done
+on arrays (with NumPy, when it is available and the column is long
+enough to make importing it worthwhile), and results are rendered once
+per distinct value.
+
+Each col_xxx(fi, infos) function returns the list of display strings
+that the corresponding nas_field_format.fmt_xxx() function would
+return for each job in infos. Values those functions would not parse
+cleanly are passed to the fmt_xxx() function itself.
+'''
+
+import nas_field_format as nff
+
+# NumPy is imported on first use, by get_numpy()
+numpy = None
+numpy_tried = False
+# Shortest column worth handing to NumPy
+numpy_min = 500
+
+__all__ = ['compile_rows']
+
+
+def compile_rows(fmtr, field_list=None, suppress=None):
+    '''Build a function that computes display values for many objects
+
+    Fields that have a column function are computed a column at a time.
+    The others are computed a row at a time by the formatter's compiled
+    row function. If a userexit has replaced a field's formatting
+    function, the replacement is called as usual.
+
+    Args:
+        fmtr = NAS_field_format object
+        field_list = list of field_info dicts, default fmtr.field_list
+        suppress = list of flags, True for each field that is suppressed
+            from the output. Suppressed fields are not computed.
+    Returns:
+        function taking a list of info dicts and returning a list of
+        rows of display values
+    '''
+    if field_list is None:
+        field_list = fmtr.field_list
+    if suppress is None:
+        suppress = [False] * len(field_list)
+    cols = []
+    others = []
+    others_suppress = []
+    for (i, fi) in enumerate(field_list):
+        name = fi['func']
+        cf = col_funcs.get(name)
+        if cf and getattr(nff, name) is cf[0] and not suppress[i]:
+            cols.append((i, fi, cf[1]))
+        else:
+            others.append(fi)
+            others_suppress.append(suppress[i])
+    row_func = fmtr.compile_row(others, others_suppress)
+    if not cols:
+        return lambda infos: [row_func(x) for x in infos]
+
+    def rows_func(infos):
+        if not infos:
+            return []
+        # Transpose the row-at-a-time values into columns, add the
+        # computed columns in place, and transpose back.
+        columns = list(zip(*[row_func(x) for x in infos])) if others \
+            else []
+        for (i, fi, func) in cols:
+            columns.insert(i, func(fi, infos))
+        return [list(x) for x in zip(*columns)]
+    return rows_func
+
+
+def get_numpy(n):
+    '''Return the numpy module, if it is available and worth using
+
+    Args:
+        n = number of values to be computed
+    Returns:
+        numpy module, or None to use plain python
+    '''
+    global numpy, numpy_tried
+    if n < numpy_min:
+        return None
+    if not numpy_tried:
+        numpy_tried = True
+        try:
+            import numpy
+        except ImportError:
+            pass
+    return numpy
+
+
+def memo_map(func, values):
+    '''Apply func to values, calling it once per distinct value'''
+    cache = dict()
+    result = []
+    for v in values:
+        try:
+            result.append(cache[v])
+        except KeyError:
+            t = cache[v] = func(v)
+            result.append(t)
+    return result
+
+
+def pick_rsrc(fi, infos):
+    '''Get raw values as fmt_from_rsrc() does'''
+    key = fi['opt'][0]
+    keys = [x + '.' + key for x in fi['sources']]
+    if len(keys) == 1:
+        k = keys[0]
+        return [x.get(k, '--') for x in infos]
+    result = []
+    for info in infos:
+        for k in keys:
+            rawv = info.get(k, '--')
+            if rawv != '--':
+                break
+        result.append(rawv)
+    return result
+
+
+def parse_clocks(values):
+    '''Convert duration strings to seconds, None if unusable
+
+    Args:
+        values = list of strings in form [days+]hh:mm[:ss]
+    Returns:
+        list of int seconds, with None where clocktosecs() would not
+        return an int.
+    '''
+    def one(v):
+        t = nff.clocktosecs(v)
+        return t if isinstance(t, int) else None
+    return memo_map(one, values)
+
+
+def render_clocks(secs):
+    '''Render durations as secstoclock(v, False, ghuman) does
+
+    Args:
+        secs = list of durations, in seconds (int or float)
+    Returns:
+        list of strings in form [days+]hh:mm
+    '''
+    if not secs:
+        return []
+    df = nff.ghuman
+    numpy = get_numpy(len(secs))
+    if numpy is not None:
+        a = numpy.array(secs)
+        neg = (a < 0).tolist()
+        dhm = ((numpy.abs(a) + 30) // 60).tolist()
+    else:
+        neg = [v < 0 for v in secs]
+        dhm = [((0 - v if v < 0 else v) + 30) // 60 for v in secs]
+
+    def one(key):
+        (n, m) = key
+        sign = '-' if n else ''
+        if df and m // 60 > 48:
+            d = m // (24 * 60)
+            daypfx = "%dd+" % d
+            m = m - d * 24 * 60
+        else:
+            daypfx = ""
+        return r'%s%s%02d:%02d' % (sign, daypfx, m // 60, m % 60)
+    return memo_map(one, zip(neg, dhm))
+
+
+def col_from_rsrc_tm(fi, infos):
+    '''Column version of fmt_from_rsrc_tm()'''
+    def one(v):
+        if v == '--':
+            return v
+        return nff.secstoclock(nff.clocktosecs(v), False, nff.ghuman)
+    return memo_map(one, pick_rsrc(fi, infos))
+
+
+def col_from_rsrc_sz(fi, infos):
+    '''Column version of fmt_from_rsrc_sz()'''
+    def one(v):
+        if v == '--':
+            return v
+        return nff.ensuffix(nff.unsuffix(v))
+    return memo_map(one, pick_rsrc(fi, infos))
+
+
+def col_elapsed(fi, infos):
+    '''Column version of fmt_elapsed()'''
+    gnow = nff.gnow
+    result = [None] * len(infos)
+    used_idx = []
+    secs = []
+    secs_idx = []
+    for (i, info) in enumerate(infos):
+        state = info.get('job_state', '?')
+        if state in 'RSBEFX':
+            used_idx.append(i)
+            continue
+        try:
+            secs.append(int(info.get('etime', gnow)))
+        except (TypeError, ValueError):
+            result[i] = nff.fmt_elapsed(fi, info)
+            continue
+        secs_idx.append(i)
+    for (i, t) in zip(used_idx, col_from_rsrc_tm(
+            {'opt': ['walltime'], 'sources': ['resources_used']},
+            [infos[i] for i in used_idx])):
+        result[i] = t
+    if secs:
+        numpy = get_numpy(len(secs))
+        if numpy is not None:
+            secs = (gnow - numpy.array(secs, dtype=float)).tolist()
+        else:
+            secs = [gnow - x for x in secs]
+        for (i, t) in zip(secs_idx, render_clocks(secs)):
+            result[i] = t
+    return result
+
+
+def col_remaining(fi, infos):
+    '''Column version of fmt_remaining()'''
+    result = [None] * len(infos)
+    reqs = parse_clocks([x.get('Resource_List.walltime', '--')
+                         for x in infos])
+    elaps = parse_clocks([x.get('resources_used.walltime', '0')
+                          for x in infos])
+    idx = []
+    req = []
+    elap = []
+    for (i, info) in enumerate(infos):
+        if 'Resource_List.walltime' not in info:
+            result[i] = '--'
+            continue
+        jstate = info.get('job_state', ' ')
+        if jstate in 'BERSU':
+            if reqs[i] is None or elaps[i] is None:
+                result[i] = nff.fmt_remaining(fi, info)
+                continue
+            e = elaps[i]
+        elif jstate in 'FX':
+            result[i] = '--'
+            continue
+        else:
+            if reqs[i] is None:
+                result[i] = nff.fmt_remaining(fi, info)
+                continue
+            e = 0
+        idx.append(i)
+        req.append(reqs[i])
+        elap.append(e)
+    if idx:
+        numpy = get_numpy(len(idx))
+        if numpy is not None:
+            rem = (numpy.array(req) - numpy.array(elap)).tolist()
+        else:
+            rem = [r - e for (r, e) in zip(req, elap)]
+        for (i, t) in zip(idx, render_clocks(rem)):
+            result[i] = t
+    return result
+
+
+def col_efficiency(fi, infos):
+    '''Column version of fmt_efficiency()'''
+    result = [None] * len(infos)
+    idx = []
+    pcts = []
+    cpus = []
+    cputs = []
+    walls = []
+    cput_raw = parse_clocks([x.get('resources_used.cput') or '--'
+                             for x in infos])
+    wall_raw = parse_clocks([x.get('resources_used.walltime') or '--'
+                             for x in infos])
+    for (i, info) in enumerate(infos):
+        ncpus = info.get('resources_used.ncpus')
+        cpu_pct = info.get('resources_used.cpupercent')
+        if not ncpus or not cpu_pct or ncpus == "0":
+            result[i] = '--'
+            continue
+        try:
+            p = float(cpu_pct)
+            n = float(ncpus)
+        except ValueError:
+            n = 0.0
+        if n == 0.0:
+            result[i] = nff.fmt_efficiency(fi, info)
+            continue
+        c = cput_raw[i]
+        w = wall_raw[i]
+        if c is None or w is None:
+            if info.get('resources_used.cput') and \
+                    info.get('resources_used.walltime'):
+                # Present, but not parsable
+                result[i] = nff.fmt_efficiency(fi, info)
+                continue
+            c = w = 0
+        idx.append(i)
+        pcts.append(p)
+        cpus.append(n)
+        cputs.append(c)
+        walls.append(w)
+    if not idx:
+        return result
+    numpy = get_numpy(len(idx))
+    if numpy is not None:
+        p = numpy.array(pcts)
+        n = numpy.array(cpus)
+        c = numpy.array(cputs, dtype=float)
+        w = numpy.array(walls, dtype=float)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            eff = p / n
+            effc = 100.0 * c / (n * w)
+        use = (n > 0) & (w > 0) & (effc < eff)
+        effs = numpy.where(use, effc, eff).tolist()
+    else:
+        effs = []
+        for (p, n, c, w) in zip(pcts, cpus, cputs, walls):
+            eff = p / n
+            if n > 0 and w > 0:
+                effc = 100.0 * c / (n * w)
+                if effc < eff:
+                    eff = effc
+            effs.append(eff)
+    for (i, eff) in zip(idx, effs):
+        result[i] = "%.0f%%" % eff
+    return result
+
+
+def col_lifetime(fi, infos):
+    '''Column version of fmt_lifetime()'''
+    gnow = nff.gnow
+    result = [None] * len(infos)
+    idx = []
+    ends = []
+    starts = []
+    for (i, info) in enumerate(infos):
+        qtime = info.get('qtime', None)
+        if not qtime:
+            result[i] = '--'
+            continue
+        try:
+            if info.get('job_state', None) in ['F', 'X']:
+                end = int(info.get('mtime', gnow))
+            else:
+                end = gnow
+            start = int(qtime)
+        except (TypeError, ValueError):
+            result[i] = nff.fmt_lifetime(fi, info)
+            continue
+        idx.append(i)
+        ends.append(end)
+        starts.append(start)
+    if idx:
+        numpy = get_numpy(len(idx))
+        if numpy is not None:
+            life = (numpy.array(ends, dtype=float) -
+                    numpy.array(starts, dtype=float)).tolist()
+        else:
+            life = [e - s for (e, s) in zip(ends, starts)]
+        for (i, t) in zip(idx, render_clocks(life)):
+            result[i] = t
+    return result
+
+
+# Map from formatting function name to (function, column function)
+col_funcs = {
+    'fmt_efficiency': (nff.fmt_efficiency, col_efficiency),
+    'fmt_elapsed': (nff.fmt_elapsed, col_elapsed),
+    'fmt_from_rsrc_sz': (nff.fmt_from_rsrc_sz, col_from_rsrc_sz),
+    'fmt_from_rsrc_tm': (nff.fmt_from_rsrc_tm, col_from_rsrc_tm),
+    'fmt_lifetime': (nff.fmt_lifetime, col_lifetime),
+    'fmt_remaining': (nff.fmt_remaining, col_remaining),
+}
+
+# vi:ts=4:sw=4:expandtab
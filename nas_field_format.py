@@ -131,7 +131,10 @@ class NAS_field_format(object):
             (fl, aset, msg) where
                 fl = list of field_info dictionaries describing field selected
                     for display
-                aset = set of PBS attributes holding data for fields in fl
+                aset = set of PBS attributes holding data for fields in fl.
+                    If conf.attr_resources is set, fields that need just
+                    some resources of an attribute contribute entries of
+                    the form attribute.resource.
                 msg = Text of any errors, None if no errors
         '''
         fl = self.default_fields
@@ -177,19 +180,90 @@ class NAS_field_format(object):
         fil = [knownmap[x] for x in fl if x in knownmap]
         alist = list()
         for x in fil:
-            t = x['sources']
-            if t:
-                alist.extend(t)
-        aset = set(alist)
+            alist.extend(field_needs(x))
+        if conf.attr_resources:
+            # Drop resources of attributes that are needed whole
+            wholes = set(x for x in alist if '.' not in x)
+            aset = set(x for x in alist
+                       if '.' not in x or x.split('.')[0] not in wholes)
+        else:
+            aset = set(x.split('.')[0] for x in alist)
         if conf.verbose:
             print("Need these attributes: %s" % ', '.join(sorted(aset)))
         return (fil, aset, '\n'.join(errlist) if errlist else None)
 
+    def field_attrs(self, fi):
+        '''Get the PBS attributes holding data for one field
+
+        Args:
+            fi = field_info dict
+        Returns:
+            set of attributes, in the same form as collect_fields()
+        '''
+        t = field_needs(fi)
+        if conf.attr_resources:
+            return set(t)
+        return set(x.split('.')[0] for x in t)
+
+    def compile_row(self, field_list=None, suppress=None):
+        '''Build a function that computes the field values for one object
+
+        Rather than look up each field's function and metadata for every
+        value displayed, generate Python code for the whole row once.
+        The common attribute and resource lookups are done inline, with
+        the keys as constants. Other fields, including those added by
+        userexits, call their formatting function directly.
+
+        Args:
+            field_list = list of field_info dicts, default self.field_list
+            suppress = list of flags, True for each field that is
+                suppressed from the output. Suppressed fields are not
+                computed, and have value '--'.
+        Returns:
+            function taking an object's info dict and returning the list
+            of display values for the fields
+        '''
+        if field_list is None:
+            field_list = self.field_list
+        if suppress is None:
+            suppress = [False] * len(field_list)
+        params = ['info']
+        lines = ['    row = []',
+                 '    append = row.append']
+        ns = dict()
+        for (i, fi) in enumerate(field_list):
+            if suppress[i]:
+                lines.append("    append('--')")
+                continue
+            func = globals()[fi['func']]
+            body = None
+            if inline_fmts.get(fi['func']) is func:
+                body = inline_fmt(fi)
+            if body is None:
+                ns['f%d' % i] = func
+                ns['fi%d' % i] = fi
+                params.append('f%d=f%d, fi%d=fi%d' % (i, i, i, i))
+                lines.append('    append(f%d(fi%d, info))' % (i, i))
+            else:
+                lines.extend(['    ' + x for x in body])
+                lines.append('    append(v)')
+        lines.insert(0, 'def _row(%s):' % ', '.join(params))
+        lines.append('    return row')
+        exec('\n'.join(lines), globals(), ns)
+        return ns['_row']
+
 
 __all__.append('gen_field')
 
 
-def gen_field(name, title, form, func, source, opt=''):
+# Functions that use only the resource named by opt[0] from each source
+rsrc_funcs = {'fmt_from_rsrc', 'fmt_from_rsrc_sz', 'fmt_from_rsrc_tm',
+              'fmt_future_date', 'fmta_count', 'fmta_free', 'fmta_mem',
+              'fmta_mfree', 'fmta_used'}
+
+
+def gen_field(name, title, form, func, source, opt='', needs=None,
+              skey=None):
     '''Create a field_info dict
 
     Args:
@@ -199,6 +273,12 @@ def gen_field(name, title, form, func, source, opt=''):
         func = name of function to calculate display value of field
         source = list of PBS attributes used by func
         opt = additional info for use by func
+        needs = list of PBS attributes (attr) and resources (attr.resource)
+            actually read by func. Defaults to the opt[0] resource of
+            each source for the fmt_from_rsrc family of functions, else
+            to source.
+        skey = name of function to compute sort keys for field, default
+            skey_display, which sorts by display value.
     '''
     if form is None:
         form = {}
@@ -209,15 +289,49 @@ def gen_field(name, title, form, func, source, opt=''):
         func = 'get_by_name'
     if source is None:
         source = ''
+    if skey is None:
+        skey = 'skey_display'
+    sources = source.split() if source else None
+    opts = opt.split()
+    if needs is not None:
+        needs = needs.split()
+    elif func in rsrc_funcs and sources and opts:
+        needs = [x + '.' + opts[0] for x in sources]
+    else:
+        needs = sources
     fi = {'name': name,
           'title': title,
           'format': form,
           'func': func,
-          'sources': source.split() if source else None,
-          'opt': opt.split()
+          'sources': sources,
+          'opt': opts,
+          'needs': needs,
+          'needs_of': (func, sources and list(sources), list(opts)),
+          'skey': skey
           }
     return fi
 
+
+def field_needs(fi):
+    '''Get the PBS attributes and resources a field reads
+
+    The needs list is used only with conf.attr_resources, and only while
+    the field still has the func, sources, and opt it was built with. If
+    a userexit or main() has since changed them, the needs list no
+    longer describes the field, so fall back to its sources.
+
+    Args:
+        fi = field_info dict
+    Returns:
+        list of attribute and attribute.resource names
+    '''
+    sources = fi['sources'] or []
+    if not conf.attr_resources or fi.get('needs') is None:
+        return sources
+    if fi.get('needs_of') != (fi['func'], fi['sources'], fi['opt']):
+        return sources
+    return fi['needs']
+
 # Module global values
 
 
@@ -298,24 +412,19 @@ def fmt_comment(fi, info):
 def fmt_date(fi, info):
     rawv = fmt_by_attr(fi, info)
     if rawv.isdigit():
-        t = time.localtime(int(rawv))
-    else:
-        if rawv == '--':
-            return rawv
-        t = time.strptime(rawv)
-    return time.strftime(r'%y-%m-%d/%H:%M', t)
+        return epoch_strftime(r'%y-%m-%d/%H:%M', int(rawv))
+    if rawv == '--':
+        return rawv
+    return strptime_strftime(r'%y-%m-%d/%H:%M', rawv)
 
 
 def fmt_date_full(fi, info):
     rawv = fmt_by_attr(fi, info)
     if rawv.isdigit():
-        t = time.localtime(int(rawv))
-    else:
-        if rawv == '--':
-            return rawv
-        t = time.strptime(rawv)
-    result = time.strftime(r'%c', t)
-    return result
+        return epoch_strftime(r'%c', int(rawv))
+    if rawv == '--':
+        return rawv
+    return strptime_strftime(r'%c', rawv)
 
 
 def fmt_duration(fi, info):
@@ -378,7 +487,7 @@ def fmt_est_end(fi, info):
     if walltime is None:
         return '--'
     wtime = clocktosecs(walltime)
-    t = time.strftime(r'%y-%m-%d/%H:%M', time.localtime(start + wtime))
+    t = epoch_strftime(r'%y-%m-%d/%H:%M', start + wtime)
     return t + guess
 
 
@@ -444,11 +553,10 @@ def fmt_future_date(fi, info):
         return '--'
     if delta > 84600:
         # More than 23 1/5 hours ahead -- use date format
-        t = time.strftime(r'%m/%d', time.localtime(eststart))
-        s = time.localtime(eststart)
-        ampm = 'P' if s[3] > 11 else 'A'
+        t = epoch_strftime(r'%m/%d', eststart)
+        ampm = 'P' if int(epoch_strftime(r'%H', eststart)) > 11 else 'A'
         return t + ampm
-    t = time.strftime(r'%H:%M', time.localtime(eststart))
+    t = epoch_strftime(r'%H:%M', eststart)
     return t
 
 
@@ -859,6 +967,186 @@ def fmta_used(fi, info):
         return v[0]
     return "0"
 
+# Functions to compute sort keys for a column of objects
+# skey_xxx(fi, infos)
+# Args:
+#   fi = field info
+#   infos = list of dicts with info for jobs
+# Returns:
+#   list of sort keys, one per object. The keys for one field are all
+#   of one type, so they compare cleanly. Missing or unparsable numeric
+#   values become missing_key, which sorts before any number.
+
+missing_key = float('-inf')
+
+
+def skey_values(values, conv):
+    '''Convert values to numeric keys, once per distinct value'''
+    cache = dict()
+    result = []
+    for v in values:
+        try:
+            result.append(cache[v])
+        except KeyError:
+            try:
+                t = conv(v)
+            except (TypeError, ValueError):
+                t = None
+            if isinstance(t, bool) or not isinstance(t, (int, float)):
+                t = missing_key
+            cache[v] = t
+            result.append(t)
+    return result
+
+
+def skey_raw(fi, infos):
+    '''Raw values of field, before formatting'''
+    if fi['func'] in rsrc_funcs and fi['opt']:
+        return [fmt_from_rsrc(fi, x) for x in infos]
+    return [fmt_by_attr(fi, x) for x in infos]
+
+
+def skey_display(fi, infos):
+    '''Display values'''
+    func = globals()[fi['func']]
+    return [func(fi, x) for x in infos]
+
+
+def skey_clock(fi, infos):
+    '''Raw durations, in seconds'''
+    return skey_values(skey_raw(fi, infos), clocktosecs)
+
+
+def skey_duration(fi, infos):
+    '''Displayed durations, in minutes'''
+    def one(v):
+        mo = durre.match(v)
+        if not mo:
+            return None
+        (sign, days, hours, minutes) = mo.groups()
+        t = int(minutes) + 60 * (int(hours) + 24 * int(days or 0))
+        return -t if sign else t
+    return skey_values(skey_display(fi, infos), one)
+
+
+durre = re.compile(r'(-)?(?:(\d+)d\+)?(\d+):(\d+)$')
+
+
+def skey_epoch(fi, infos):
+    '''Raw epoch times'''
+    return skey_values(skey_raw(fi, infos), int)
+
+
+def skey_jobid(fi, infos):
+    '''Job IDs, ordered by server, sequence number, then array index'''
+    result = []
+    for info in infos:
+        (seq, _, parent) = info.get('id', '').partition('.')
+        (seq, _, idx) = seq.partition('[')
+        result.append((parent, safeint(seq), safeint(idx.rstrip(']'))))
+    return result
+
+
+def skey_number(fi, infos):
+    '''Displayed numbers, ignoring any trailing %'''
+    return skey_values(skey_display(fi, infos),
+                       lambda v: float(v.rstrip('%')))
+
+
+def skey_size(fi, infos):
+    '''Raw sizes, in bytes'''
+    return skey_values(skey_raw(fi, infos), unsuffix)
+
+
+def skey_state(fi, infos):
+    '''Job states, in the order the scheduler considers them'''
+    return ['BRFQHWTEX'.find(x.get('job_state', '?')) for x in infos]
+
+
+def skey_default(fi, infos):
+    '''Usual nas_qstat job order
+
+    Running jobs come first, ordered by priority, queue and size. Then
+    queued jobs, in the scheduler's order (spri), when known. Then the
+    rest, by job ID.
+    '''
+    clocks = dict()
+    result = []
+    for job in infos:
+        st = job.get('job_state', '?')
+        k1 = 'BRFQHWTEX'.find(st)
+        if st in 'BRFQ':
+            wt = job.get('Resource_List.walltime', '')
+            k5 = clocks.get(wt)
+            if k5 is None:
+                k5 = clocktosecs(wt)
+                if not isinstance(k5, int):
+                    k5 = 0
+                clocks[wt] = k5
+        if st in 'BRF':
+            k2 = safeint(job.get('Priority', '0'))
+            k3 = job.get('queue', '')
+            k4 = safeint(job.get('Resource_List.ncpus', '0'))
+            result.append((k1, -k2, k3, -k4, -k5))
+            continue
+        (seq, _, parent) = job.get('id', '1.unknown').partition('.')
+        (seq, _, idx) = seq.partition('[')
+        if st == 'Q':
+            k2 = safeint(job.get('spri', '999999'))
+            k3 = safeint(job.get('Priority', '0'))
+            k4 = safeint(job.get('Resource_List.nodect', '0'))
+            result.append((k1, k2, -k3, -k4, -k5, parent, safeint(seq),
+                           safeint(idx.rstrip(']'))))
+        else:
+            result.append((k1, parent, safeint(seq),
+                           safeint(idx.rstrip(']'))))
+    return result
+
+# Code generation for NAS_field_format.compile_row()
+
+
+def inline_fmt(fi):
+    '''Generate inline code for a formatting function
+
+    Args:
+        fi = field info
+    Returns:
+        list of source lines that leave the field's value in v, or
+        None if the field's function must be called.
+    '''
+    func = fi['func']
+    src = fi['sources']
+    if func in ('fmt_by_attr', 'fmt_by_name'):
+        key = src[0] if func == 'fmt_by_attr' and src else fi['name']
+        return ['v = info[%r] if %r in info else info.get(%r, \'--\')' %
+                (key, key, 'Resource_List.' + key)]
+    if not fi['opt']:
+        return None
+    key = fi['opt'][0]
+    if func == 'fmt_from_opt':
+        return ['v = str(info.get(%r, \'--\'))' % key]
+    if not src:
+        return None
+    # fmt_from_rsrc family: first of the sources to have the resource
+    lines = ['v = info.get(%r, \'--\')' % (src[0] + '.' + key)]
+    for x in src[1:]:
+        lines.append('if v == \'--\':')
+        lines.append('    v = info.get(%r, \'--\')' % (x + '.' + key))
+    if func == 'fmt_from_rsrc_tm':
+        lines.append('if v != \'--\':')
+        lines.append('    v = secstoclock(clocktosecs(v), False, ghuman)')
+    elif func == 'fmt_from_rsrc_sz':
+        lines.append('if v != \'--\':')
+        lines.append('    v = ensuffix(unsuffix(v))')
+    return lines
+
+
+# Formatting functions inline_fmt() knows how to generate code for
+inline_fmts = {'fmt_by_attr': fmt_by_attr, 'fmt_by_name': fmt_by_name,
+               'fmt_from_opt': fmt_from_opt, 'fmt_from_rsrc': fmt_from_rsrc,
+               'fmt_from_rsrc_sz': fmt_from_rsrc_sz,
+               'fmt_from_rsrc_tm': fmt_from_rsrc_tm}
+
 # Misc helper functions for formatting routines
 
 
@@ -916,7 +1204,7 @@ def clocktosecs(v):
 
 
 def decode_epoch_full(rawv):
-    result = time.strftime('%c', time.localtime(int(rawv)))
+    result = epoch_strftime('%c', int(rawv))
     return result
 
 
@@ -1050,6 +1338,99 @@ def ensuffix(v, units=None):
     return "%d%s" % (t, scale)
 
 
+__all__.append('epoch_strftime')
+
+# Cache of epoch_strftime() results, by (format, minute). The value is
+# a tuple of the pieces of the formatted minute that surround its
+# seconds, or None if the format cannot be cached.
+epoch_cache = dict()
+# Cache of strptime_strftime() results, by (format, date string)
+strptime_cache = dict()
+
+
+def epoch_strftime(fmt, epoch):
+    '''Format an epoch time as local time, like strftime(localtime())
+
+    Many jobs have times in the same minute, so each minute is broken
+    down and formatted only once. If the format includes the seconds
+    (e.g., %c or %X), they are filled into the cached text.
+
+    Args:
+        fmt = strftime format
+        epoch = seconds since the epoch
+    Returns:
+        formatted time
+    '''
+    if not isinstance(epoch, int):
+        return time.strftime(fmt, time.localtime(epoch))
+    (minute, sec) = divmod(epoch, 60)
+    key = (fmt, minute)
+    try:
+        pieces = epoch_cache[key]
+    except KeyError:
+        pieces = epoch_cache[key] = epoch_template(fmt, minute * 60)
+    if pieces is None:
+        return time.strftime(fmt, time.localtime(epoch))
+    if len(pieces) == 1:
+        return pieces[0]
+    return ('%02d' % sec).join(pieces)
+
+
+def epoch_template(fmt, start):
+    '''Format the minute beginning at start, marking where seconds go
+
+    Formats the minute with the seconds set to 00 and to 59 and
+    compares the results. Wherever they differ, 00 versus 59, is where
+    the seconds appear.
+
+    Args:
+        fmt = strftime format
+        start = epoch time at the start of a minute
+    Returns:
+        tuple of the text around each occurrence of the seconds, or None
+        if the format cannot be handled this way (e.g., %s), or local
+        time is not whole minutes offset from UTC.
+    '''
+    tm = time.localtime(start)
+    if tm.tm_sec != 0:
+        return None
+    t0 = time.strftime(fmt, tm)
+    t59 = time.strftime(fmt, tm[:5] + (59,) + tm[6:])
+    if len(t0) != len(t59):
+        return None
+    pieces = []
+    prev = 0
+    i = 0
+    while i < len(t0):
+        if t0[i] == t59[i]:
+            i += 1
+            continue
+        if t0[i:i + 2] != '00' or t59[i:i + 2] != '59':
+            return None
+        pieces.append(t0[prev:i])
+        i += 2
+        prev = i
+    pieces.append(t0[prev:])
+    return tuple(pieces)
+
+
+def strptime_strftime(fmt, rawv):
+    '''Reformat a date string, like strftime(strptime())
+
+    Args:
+        fmt = strftime format
+        rawv = date string in the default strptime() format
+    Returns:
+        formatted time
+    '''
+    key = (fmt, rawv)
+    try:
+        return strptime_cache[key]
+    except KeyError:
+        pass
+    result = strptime_cache[key] = time.strftime(fmt, time.strptime(rawv))
+    return result
+
 __all__.append('format_resvs')
 
 
@@ -306,21 +306,18 @@ def load_usage(root):
 
 def load_usage_from_jobs(fname, tree, patts, weights):
     global asof_time
-    from nas_pbsutil import lines_to_stat
+    from nas_pbsutil import iter_stat
     if fname == '-':
         fs = stdin
     else:
         fs = open(fname)
         stat_buf = os.stat(fname)
         asof_time = stat_buf.st_mtime
-    lines = fs.read()
-    if fname != '-':
-        fs.close()
     interesting = ['egroup', 'euser', 'resources_used', 'schedselect',
                    'Account_Name', 'job_state', 'obittime', 'stime']
-    jobs = lines_to_stat(lines, interesting)
-    del lines
-    for job in jobs:
+    # Process the jobs as they are read, so the whole file and all
+    # the jobs need not be in memory at once.
+    for job in iter_stat(fs, interesting):
         jobname = job['id']
         entity = set_account_name(job, patts)
         if entity not in share_name_map:
@@ -335,6 +332,8 @@ def load_usage_from_jobs(fname, tree, patts, weights):
         eff_sbus = sbu_rate * effective_wt
         share = share_name_map[entity]
         share.usage += eff_sbus
+    if fname != '-':
+        fs.close()
     return True
 
 
@@ -650,6 +649,65 @@ def load_fs_info(fname):
     return (tree, patt_list, weight_dict)
 
 
+def fs_info_to_tuples(info):
+    '''Flatten the results of load_fs_info() for marshal
+
+    Links between shares are replaced by indexes into a list of the
+    shares, and patterns by their source text, so the results can be
+    saved in a cache.
+
+    Args:
+        info = (tree, patterns, weights) tuple from load_fs_info()
+    Returns:
+        tuple of built-in types, for fs_info_from_tuples()
+    '''
+    (tree, patts, weights) = info
+    index = dict()
+    for share in [tree] + list(share_name_map.values()) + \
+            list(share_id_map.values()):
+        index.setdefault(id(share), (len(index), share))
+    shares = []
+    for (i, share) in index.values():
+        t = dict(vars(share))
+        for key in ('parent', 'sibling', 'child'):
+            if t[key] is not None:
+                t[key] = index[id(t[key])][0]
+        shares.append(t)
+    names = [(key, index[id(x)][0]) for (key, x) in share_name_map.items()]
+    ids = [(key, index[id(x)][0]) for (key, x) in share_id_map.items()]
+    patts = [(patt.pattern, entity) for (patt, entity) in patts]
+    return (shares, names, ids, patts, weights)
+
+
+def fs_info_from_tuples(flat):
+    '''Rebuild the results of load_fs_info() from fs_info_to_tuples()
+
+    As load_fs_info() does, this fills in share_name_map and share_id_map.
+
+    Args:
+        flat = result from fs_info_to_tuples()
+    Returns:
+        Same as load_fs_info()
+    '''
+    (shares, names, ids, patts, weights) = flat
+    objs = []
+    for t in shares:
+        share = Share.__new__(Share)
+        share.__dict__.update(t)
+        objs.append(share)
+    for share in objs:
+        for key in ('parent', 'sibling', 'child'):
+            i = getattr(share, key)
+            if i is not None:
+                setattr(share, key, objs[i])
+    for (key, i) in names:
+        share_name_map[key] = objs[i]
+    for (key, i) in ids:
+        share_id_map[key] = objs[i]
+    patts = [(re.compile(patt), entity) for (patt, entity) in patts]
+    return (objs[0], patts, weights)
+
+
 def build_tree(fname, lines):
     '''Build tree(fname, lines)
 
@@ -0,0 +1,698 @@
+'''
+Stand-in for the pbs_ifl module that simulates PBS servers
+
+The commands use this module in place of pbs_ifl when the NAS_IFL_SIM
+environment variable is set, so they can be tried out and benchmarked
+on hosts without OpenPBS or a built pbs_ifl module. Each server named
+in a pbs_connect() call gets its own synthetic, but repeatable,
+population of jobs, vnodes, queues, and reservations that looks like a
+busy cluster: whole-node jobs, a few thousand users in a few hundred
+groups, most jobs queued, running jobs filling the vnodes.
+
+The value of NAS_IFL_SIM is a comma separated list of options:
+    jobs=N          number of jobs per server (default 1000)
+    vnodes=N        number of vnodes per server (default 100)
+    finished=N      number of finished jobs, shown with -x (default 0)
+    seed=N          random seed (default 1)
+    server=NAME     default server (default $PBS_DEFAULT, else pbssim)
+    now=EPOCH       time the data are "as of" (default current time)
+    latency=SECS    delay added to each call (default 0)
+    bandwidth=MB    reply size, in MB per second, that adds a delay
+                    for large replies (default 0, no delay)
+Any other value (e.g., 1) selects all the defaults.
+
+Attribute lists, select criteria, job ids, queue names, and the x
+extend flag are honored as the server would honor them.
+'''
+
+import os
+import random
+import threading
+import time
+import zlib
+
+# Operators for attropl
+(SET, UNSET, INCR, DECR, EQ, NE, GE, GT, LE, LT, DFLT) = range(11)
+(MGR_CMD_NONE, MGR_CMD_CREATE, MGR_CMD_DELETE, MGR_CMD_SET, MGR_CMD_UNSET,
+ MGR_CMD_LIST, MGR_CMD_PRINT, MGR_CMD_ACTIVE, MGR_CMD_IMPORT,
+ MGR_CMD_EXPORT) = range(-1, 9)
+
+ATTR_ctime = 'ctime'
+ATTR_etime = 'etime'
+ATTR_mtime = 'mtime'
+ATTR_qtime = 'qtime'
+ATTR_stime = 'stime'
+ATTR_obittime = 'obittime'
+ATTR_estimated = 'estimated'
+ATTR_resv_start = 'reserve_start'
+ATTR_resv_end = 'reserve_end'
+
+# Error numbers, as in pbs_error.h
+PBSE_UNKJOBID = 15001
+PBSE_UNKQUE = 15018
+PBSE_NOSERVER = 15034
+PBSE_UNKNODE = 15062
+error_msgs = {
+    PBSE_UNKJOBID: 'Unknown Job Id',
+    PBSE_UNKQUE: 'Unknown queue',
+    PBSE_NOSERVER: 'No server to connect to',
+    PBSE_UNKNODE: 'Unknown node',
+}
+
+CPUS_PER_NODE = 40
+MEM_PER_NODE = 192 * 1024 * 1024      # kb
+MODELS = [('sky', 1.0), ('cas', 1.0), ('rom', 4.0), ('mil', 4.0)]
+QUEUES = [('normal', 60, 8 * 3600), ('long', 15, 120 * 3600),
+          ('debug', 10, 2 * 3600), ('devel', 5, 2 * 3600),
+          ('low', 8, 4 * 3600), ('wide', 2, 24 * 3600)]
+
+
+class attrl(object):
+    '''Attribute list entry, as in pbs_ifl.h'''
+
+    def __init__(self):
+        self.name = None
+        self.resource = None
+        self.value = ''
+        self.next = None
+
+
+class attropl(attrl):
+    '''Attribute operation list entry, as in pbs_ifl.h'''
+
+    def __init__(self):
+        super().__init__()
+        self.op = SET
+
+
+class PbsConf(object):
+    '''The interesting parts of struct pbs_config'''
+
+    def __init__(self):
+        self.pbs_server_name = None
+        self.pbs_exec_path = None
+        self.pbs_home_path = None
+
+
+class CVar(object):
+    '''Global variables, as SWIG makes them available'''
+
+    def __init__(self):
+        self.pbs_conf = PbsConf()
+
+
+cvar = CVar()
+
+
+def parse_options(text):
+    '''Parse the NAS_IFL_SIM value
+
+    Args:
+        text = comma separated list of name=value options
+    Returns:
+        dict of option values
+    '''
+    opts = {
+        'jobs': 1000,
+        'vnodes': 100,
+        'finished': 0,
+        'seed': 1,
+        'server': os.environ.get('PBS_DEFAULT') or 'pbssim',
+        'now': None,
+        'latency': 0.0,
+        'bandwidth': 0.0,
+    }
+    for item in (text or '').split(','):
+        if '=' not in item:
+            continue
+        (name, value) = [x.strip() for x in item.split('=', 1)]
+        if name not in opts:
+            raise ValueError('Unknown NAS_IFL_SIM option: %s' % name)
+        if name == 'server':
+            opts[name] = value
+        elif name in ('latency', 'bandwidth'):
+            opts[name] = float(value)
+        else:
+            opts[name] = int(value)
+    return opts
+
+
+options = parse_options(os.environ.get('NAS_IFL_SIM'))
+# Simulated servers, by name
+servers = dict()
+servers_lock = threading.Lock()
+# Open connections: handle -> server name
+connections = dict()
+next_handle = 1
+# Error number of last call, per thread
+tls = threading.local()
+
+
+def hms(secs):
+    '''Format duration in seconds as hh:mm:ss'''
+    return '%02d:%02d:%02d' % (secs // 3600, secs // 60 % 60, secs % 60)
+
+
+def state_count(st):
+    '''Format state counts as in server and queue status'''
+    names = [('T', 'Transit'), ('Q', 'Queued'), ('H', 'Held'),
+             ('W', 'Waiting'), ('R', 'Running'), ('E', 'Exiting'),
+             ('B', 'Begun')]
+    return ' '.join(['%s:%d' % (n, st.get(s, 0)) for (s, n) in names])
+
+
+class Cluster:
+    '''Random but repeatable state of one simulated server
+
+    Each xxx_items() method returns the list of dicts that the
+    corresponding pbs_statxxx() call would return for all objects,
+    with all attributes.
+    '''
+
+    def __init__(self, njobs, nvnodes, server, seed, now, nfinished=0):
+        self.rng = random.Random(seed)
+        self.server = server
+        self.now = now
+        self.njobs = njobs
+        self.nvnodes = nvnodes
+        self.nusers = max(10, min(3000, njobs // 20))
+        self.ngroups = max(3, self.nusers // 10)
+        self.vnodes = ['r%di%dn%d' % (i // 288, i // 18 % 16, i % 18)
+                       for i in range(nvnodes)]
+        self.node_model = [MODELS[i * len(MODELS) // max(nvnodes, 1)][0]
+                           for i in range(nvnodes)]
+        self.node_jobs = [[] for i in range(nvnodes)]
+        self.node_state = ['free'] * nvnodes
+        self.jobs = []
+        self.resvs = []
+        self.make_resvs()
+        self.make_jobs(nfinished)
+
+    def user(self, i):
+        return 'u%05d' % i
+
+    def group(self, i):
+        return 'g%04d' % (i % self.ngroups)
+
+    def make_resvs(self):
+        '''Set aside a few blocks of vnodes for reservations'''
+        rng = self.rng
+        now = self.now
+        nresv = max(1, self.nvnodes // 500)
+        self.reserved = set()
+        for r in range(nresv):
+            size = rng.randint(1, max(1, self.nvnodes // 50))
+            first = rng.randrange(0, max(1, self.nvnodes - size))
+            nodes = list(range(first, first + size))
+            running = r % 2 == 0
+            start = now - 3600 if running else now + rng.randint(1, 72) * 3600
+            duration = rng.choice([4, 8, 24, 48]) * 3600
+            if running:
+                self.reserved.update(nodes)
+            self.resvs.append((r, nodes, start, duration, running))
+        for i in range(self.nvnodes):
+            x = rng.random()
+            if x < 0.02:
+                self.node_state[i] = 'down'
+            elif x < 0.04:
+                self.node_state[i] = 'offline'
+
+    def make_jobs(self, nfinished):
+        '''Generate jobs, running as long as there are free vnodes'''
+        rng = self.rng
+        free = [i for i in range(self.nvnodes)
+                if self.node_state[i] == 'free' and i not in self.reserved]
+        rng.shuffle(free)
+        qnames = [q[0] for q in QUEUES]
+        qweights = [q[1] for q in QUEUES]
+        qwall = dict((q[0], q[2]) for q in QUEUES)
+        seq = 100000
+        for i in range(self.njobs + nfinished):
+            seq += rng.randint(1, 3)
+            u = int(rng.paretovariate(1.2)) % self.nusers
+            queue = rng.choices(qnames, qweights)[0]
+            nodes = rng.choice([1, 1, 1, 2, 2, 4, 8, 16, 32, 128])
+            if queue == 'wide':
+                nodes *= 16
+            walltime = rng.randint(1, qwall[queue] // 900) * 900
+            qtime = self.now - rng.randint(60, 14 * 86400)
+            if i >= self.njobs:
+                state = 'F'
+                used = [rng.randrange(self.nvnodes)
+                        for n in range(min(nodes, self.nvnodes))]
+            elif len(free) >= nodes and rng.random() < 0.3:
+                state = 'R'
+                used = [free.pop() for n in range(nodes)]
+            else:
+                state = rng.choice('QQQQQQQHHW')
+                used = []
+            self.jobs.append((seq, u, queue, nodes, walltime, qtime,
+                              state, used))
+            if state == 'F':
+                continue
+            for n in used:
+                self.node_jobs[n].append('%d.%s' % (seq, self.server))
+                self.node_state[n] = 'job-exclusive'
+
+    def jobs_items(self):
+        '''Generate job status'''
+        rng = self.rng
+        now = self.now
+        result = []
+        for (seq, u, queue, nodes, walltime, qtime, state, used) in \
+                self.jobs:
+            user = self.user(u)
+            group = self.group(u)
+            model = self.node_model[used[0]] if used else \
+                MODELS[seq % len(MODELS)][0]
+            ncpus = nodes * CPUS_PER_NODE
+            select = '%d:ncpus=%d:model=%s' % (nodes, CPUS_PER_NODE, model)
+            a = {'id': '%d.%s' % (seq, self.server),
+                 'Job_Name': rng.choice(['run', 'sim_', 'STDIN', 'job'])
+                 + str(seq % 1000),
+                 'Job_Owner': '%s@pfe%d.nas.nasa.gov' % (user, u % 20),
+                 'job_state': state,
+                 'queue': queue,
+                 'server': self.server,
+                 'Checkpoint': 'u',
+                 'ctime': str(qtime),
+                 'Error_Path': 'pfe:/home/%s/job.e%d' % (user, seq),
+                 'Hold_Types': 'u' if state == 'H' else 'n',
+                 'Join_Path': 'oe',
+                 'Keep_Files': 'n',
+                 'Mail_Points': 'a',
+                 'mtime': str(qtime + 10),
+                 'Output_Path': 'pfe:/home/%s/job.o%d' % (user, seq),
+                 'Priority': str(rng.randint(0, 20)),
+                 'qtime': str(qtime),
+                 'Rerunable': 'False',
+                 'Resource_List.mem': '%dgb' % (nodes * 180),
+                 'Resource_List.model': model,
+                 'Resource_List.ncpus': str(ncpus),
+                 'Resource_List.nodect': str(nodes),
+                 'Resource_List.place': 'scatter:excl',
+                 'Resource_List.select': select,
+                 'Resource_List.walltime': hms(walltime),
+                 'schedselect': select,
+                 'substate': '42' if state == 'R' else '10',
+                 'Variable_List': 'PBS_O_HOME=/home/%s,PBS_O_LANG=C,'
+                 'PBS_O_LOGNAME=%s,PBS_O_PATH=/usr/bin:/bin,'
+                 'PBS_O_SHELL=/bin/bash,PBS_O_WORKDIR=/nobackup/%s,'
+                 'PBS_O_QUEUE=%s' % (user, user, user, queue),
+                 'euser': user,
+                 'egroup': group,
+                 'queue_rank': str(seq),
+                 'queue_type': 'E',
+                 'etime': str(qtime + rng.randint(0, 600)),
+                 'Submit_arguments': '-q %s job.pbs' % queue,
+                 'project': '_pbs_project_default',
+                 'Submit_Host': 'pfe%d.nas.nasa.gov' % (u % 20)}
+            if state in 'RF':
+                elapsed = rng.randint(60, walltime)
+                if state == 'F':
+                    end = rng.randint(qtime + elapsed,
+                                      max(qtime + elapsed, now))
+                    stime = end - elapsed
+                    a['substate'] = '92'
+                    a['obittime'] = str(stime + elapsed)
+                    a['Exit_status'] = str(rng.choice([0, 0, 0, 1, 271]))
+                    a['mtime'] = a['obittime']
+                else:
+                    stime = now - elapsed
+                eff = rng.uniform(0.05, 1.0)
+                cput = int(elapsed * ncpus * eff)
+                hosts = [self.vnodes[n] for n in used]
+                a['stime'] = str(stime)
+                a['exec_host'] = '+'.join(['%s/0*%d' % (h, CPUS_PER_NODE)
+                                           for h in hosts])
+                a['exec_vnode'] = '+'.join(['(%s:ncpus=%d:mem=%dkb)'
+                                            % (h, CPUS_PER_NODE,
+                                               MEM_PER_NODE)
+                                            for h in hosts])
+                a['session_id'] = str(rng.randint(1000, 99999))
+                a['resources_used.cpupercent'] = str(int(eff * ncpus * 100))
+                a['resources_used.cput'] = hms(cput)
+                a['resources_used.mem'] = '%dkb' % rng.randint(
+                    1, MEM_PER_NODE * nodes)
+                a['resources_used.ncpus'] = str(ncpus)
+                a['resources_used.vmem'] = '%dkb' % rng.randint(
+                    1, MEM_PER_NODE * nodes)
+                a['resources_used.walltime'] = hms(elapsed)
+                a['comment'] = 'Job run at %s on (%s:ncpus=%d)...' % (
+                    time.strftime('%a %b %d at %H:%M', time.gmtime(stime)),
+                    hosts[0], CPUS_PER_NODE)
+            elif state == 'Q':
+                a['comment'] = 'Not Running: Insufficient amount of ' \
+                    'resource: ncpus (R: %d A: 0 T: %d)' % (
+                        ncpus, self.nvnodes * CPUS_PER_NODE)
+                a['estimated.start_time'] = str(
+                    now + rng.randint(60, 7 * 86400))
+            elif state == 'W':
+                a['Execution_Time'] = str(now + rng.randint(60, 86400))
+            result.append(a)
+        return result
+
+    def vnodes_items(self):
+        '''Generate vnode status'''
+        result = []
+        for (i, name) in enumerate(self.vnodes):
+            jobs = self.node_jobs[i]
+            state = self.node_state[i]
+            ncpus = CPUS_PER_NODE if jobs else 0
+            a = {'id': name,
+                 'Mom': name + '.nas.nasa.gov',
+                 'Port': '15002',
+                 'pbs_version': '2022.1.1',
+                 'ntype': 'PBS',
+                 'state': state,
+                 'pcpus': str(CPUS_PER_NODE),
+                 'resources_available.arch': 'linux',
+                 'resources_available.host': name,
+                 'resources_available.mem': '%dkb' % MEM_PER_NODE,
+                 'resources_available.model': self.node_model[i],
+                 'resources_available.ncpus': str(CPUS_PER_NODE),
+                 'resources_available.vnode': name,
+                 'resources_assigned.mem':
+                 '%dkb' % (MEM_PER_NODE if jobs else 0),
+                 'resources_assigned.ncpus': str(ncpus),
+                 'resv_enable': 'True',
+                 'sharing': 'default_excl'}
+            if jobs:
+                a['jobs'] = ', '.join(['%s/%d' % (j, c) for j in jobs
+                                       for c in range(CPUS_PER_NODE)])
+            if state in ('down', 'offline'):
+                a['comment'] = 'hardware problem, ticket %d' % i
+            result.append(a)
+        return result
+
+    def resvs_items(self):
+        '''Generate reservation status'''
+        result = []
+        for (r, nodes, start, duration, running) in self.resvs:
+            rid = 'R%d.%s' % (1000 + r, self.server)
+            user = self.user(r)
+            result.append({
+                'id': rid,
+                'Reserve_Name': 'maint%d' % r,
+                'Reserve_Owner': '%s@pfe1.nas.nasa.gov' % user,
+                'reserve_type': '2',
+                'reserve_state': '5' if running else '2',
+                'reserve_substate': '5' if running else '2',
+                'reserve_start': str(start),
+                'reserve_end': str(start + duration),
+                'reserve_duration': str(duration),
+                'queue': rid.split('.')[0],
+                'Resource_List.ncpus': str(len(nodes) * CPUS_PER_NODE),
+                'Resource_List.nodect': str(len(nodes)),
+                'Resource_List.select': '%d:ncpus=%d' % (len(nodes),
+                                                         CPUS_PER_NODE),
+                'Resource_List.walltime': hms(duration),
+                'resv_nodes': '+'.join(['(%s:ncpus=%d)'
+                                        % (self.vnodes[n], CPUS_PER_NODE)
+                                        for n in nodes]),
+                'Authorized_Users': user,
+                'server': self.server,
+                'ctime': str(self.now - 86400),
+                'mtime': str(self.now - 3600)})
+        return result
+
+    def queues_items(self):
+        '''Generate queue status'''
+        counts = dict()
+        for job in self.jobs:
+            counts.setdefault(job[2], dict())
+            st = counts[job[2]]
+            st[job[6]] = st.get(job[6], 0) + 1
+        result = []
+        for (q, weight, maxwall) in QUEUES:
+            st = counts.get(q, dict())
+            result.append({
+                'id': q,
+                'queue_type': 'Execution',
+                'total_jobs': str(sum(st.values())),
+                'state_count': state_count(st),
+                'resources_max.walltime': hms(maxwall),
+                'resources_default.walltime': hms(min(maxwall, 7200)),
+                'enabled': 'True',
+                'started': 'True'})
+        return result
+
+    def server_items(self):
+        '''Generate server status'''
+        st = dict()
+        for job in self.jobs:
+            st[job[6]] = st.get(job[6], 0) + 1
+        return [{
+            'id': self.server,
+            'server_state': 'Active',
+            'server_host': self.server,
+            'scheduling': 'True',
+            'total_jobs': str(len(self.jobs)),
+            'state_count': state_count(st),
+            'default_queue': 'normal',
+            'log_events': '511',
+            'query_other_jobs': 'True',
+            'resources_default.ncpus': '1',
+            'scheduler_iteration': '600',
+            'pbs_version': '2022.1.1'}]
+
+
+def get_cluster(server):
+    '''Get the simulated state of a server, creating it on first use
+
+    Returns:
+        dict mapping stat kind (jobs, vnodes, resvs, queues, server)
+        to list of items
+    '''
+    with servers_lock:
+        state = servers.get(server)
+        if state is None:
+            now = options['now'] or int(time.time())
+            # Give each server different, but repeatable, contents
+            seed = options['seed'] + zlib.crc32(server.encode())
+            cl = Cluster(options['jobs'], options['vnodes'], server, seed,
+                         now, options['finished'])
+            state = servers[server] = dict()
+            for kind in ('jobs', 'vnodes', 'resvs', 'queues', 'server'):
+                state[kind] = getattr(cl, kind + '_items')()
+        return state
+
+
+def attrl_names(attrib):
+    '''Convert attrl to set of names (attr or attr.resource), None for all'''
+    if attrib is None:
+        return None
+    names = set()
+    while attrib:
+        if attrib.resource:
+            names.add(attrib.name + '.' + attrib.resource)
+        else:
+            names.add(attrib.name)
+        attrib = attrib.next
+    return names
+
+
+def project(items, attrib):
+    '''Copy items, limited to the attributes in attrib'''
+    names = attrl_names(attrib)
+    if not names:
+        return [dict(x) for x in items]
+    result = []
+    for item in items:
+        t = {'id': item['id']}
+        for (key, value) in item.items():
+            if key in names or key.split('.')[0] in names:
+                t[key] = value
+        result.append(t)
+    return result
+
+
+def compare(value, op, want):
+    '''Test value against select criterion, as the server would'''
+    if value is None:
+        return op == NE
+    try:
+        (value, want) = (float(value), float(want))
+    except ValueError:
+        pass
+    if op == NE:
+        return value != want
+    if op == GE:
+        return value >= want
+    if op == GT:
+        return value > want
+    if op == LE:
+        return value <= want
+    if op == LT:
+        return value < want
+    return value == want
+
+
+def make_test(crit):
+    '''Convert one attropl entry to a function testing a job'''
+    key = crit.name
+    if crit.resource:
+        key += '.' + crit.resource
+    op = crit.op
+    want = crit.value
+    if key == 'job_state':
+        # Any of the listed states
+        if op == NE:
+            return lambda j: j['job_state'] not in want
+        return lambda j: j['job_state'] in want
+    if key == 'User_List':
+        users = set(x.split('@')[0] for x in want.split(','))
+        return lambda j: j['euser'] in users
+    return lambda j: compare(j.get(key), op, want)
+
+
+def call_cost(result):
+    '''Simulate the time to make a call and receive its result'''
+    delay = options['latency']
+    if options['bandwidth'] > 0 and result:
+        size = sum([sum([len(k) + len(v) + 8 for (k, v) in x.items()])
+                    for x in result])
+        delay += size / (options['bandwidth'] * 1e6)
+    if delay > 0:
+        time.sleep(delay)
+
+
+def set_errno(err):
+    tls.errno = err
+
+
+def conn_server(c):
+    '''Get server name for connection handle, None if not connected'''
+    server = connections.get(c)
+    if server is None:
+        set_errno(PBSE_NOSERVER)
+    return server
+
+
+def stat(c, kind, ids, attrib, err):
+    '''Common code for pbs_statque(), pbs_statvnode(), pbs_statresv()'''
+    set_errno(0)
+    server = conn_server(c)
+    if server is None:
+        return None
+    items = get_cluster(server)[kind]
+    if ids:
+        want = set([x.strip() for x in ids.split(',')])
+        items = [x for x in items if x['id'] in want]
+        if not items:
+            set_errno(err)
+    result = project(items, attrib)
+    call_cost(result)
+    return result
+
+
+# Functions from pbs_ifl
+
+
+def pbs_loadconf(reload):
+    conf = cvar.pbs_conf
+    conf.pbs_server_name = options['server']
+    conf.pbs_exec_path = os.environ.get('PBS_EXEC', '/opt/pbs')
+    conf.pbs_home_path = os.environ.get('PBS_HOME', '/var/spool/pbs')
+    return 1
+
+
+def pbs_connect(server):
+    global next_handle
+    set_errno(0)
+    if not server:
+        server = options['server']
+    call_cost(None)
+    with servers_lock:
+        c = next_handle
+        next_handle += 1
+        connections[c] = server
+    return c
+
+
+def pbs_disconnect(c):
+    connections.pop(c, None)
+    return 0
+
+
+def get_pbs_errno():
+    return getattr(tls, 'errno', 0)
+
+
+def pbs_geterrmsg(c):
+    return error_msgs.get(get_pbs_errno(), '')
+
+
+def get_pbs_version():
+    return 'sim'
+
+
+def pbs_statjob(c, id, attrib, extend):
+    return select_jobs(c, id, None, attrib, extend)
+
+
+def pbs_selstat(c, select, attrib, extend):
+    return select_jobs(c, None, select, attrib, extend)
+
+
+def pbs_statque(c, id, attrib, extend):
+    return stat(c, 'queues', id, attrib, PBSE_UNKQUE)
+
+
+def pbs_statserver(c, attrib, extend):
+    return stat(c, 'server', None, attrib, 0)
+
+
+def pbs_statvnode(c, id, attrib, extend):
+    return stat(c, 'vnodes', id, attrib, PBSE_UNKNODE)
+
+
+def pbs_statresv(c, id, attrib, extend):
+    return stat(c, 'resvs', id, attrib, 0)
+
+
+def select_jobs(c, id, select, attrib, extend):
+    '''Common code for pbs_statjob() and pbs_selstat()
+
+    Args:
+        c = connection handle
+        id = comma separated job ids or queue names, None or @server
+            for all jobs
+        select = attropl of selection criteria
+        attrib = attrl of attributes to return, None for all
+        extend = extend flags
+    Returns:
+        list of job dicts
+    '''
+    set_errno(0)
+    server = conn_server(c)
+    if server is None:
+        return None
+    jobs = get_cluster(server)['jobs']
+    tests = []
+    while select:
+        tests.append(make_test(select))
+        select = select.next
+    names = None
+    if id and not id.startswith('@'):
+        names = set([x.strip() for x in id.split(',')])
+    history = 'x' in (extend or '')
+    result = []
+    for job in jobs:
+        if not history and job['job_state'] in 'FMX':
+            continue
+        if names and job['id'] not in names and job['queue'] not in names:
+            continue
+        if not all([t(job) for t in tests]):
+            continue
+        result.append(job)
+    if names and not result:
+        queues = set([x['id'] for x in get_cluster(server)['queues']])
+        if not names & queues:
+            first = sorted(names)[0]
+            set_errno(PBSE_UNKJOBID if first[0].isdigit() else PBSE_UNKQUE)
+    result = project(result, attrib)
+    call_cost(result)
+    return result
+
+# vi:ts=4:sw=4:expandtab
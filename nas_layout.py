@@ -3,8 +3,14 @@
 The layout module takes rows of lists of column values and produces
 a list of lines where the columns line up. It performs justification
 and truncation along the way.
+
+For scripts, format_lines() instead produces the rows in a
+machine-readable format, one line per row, without alignment.
 """
 
+# Machine-readable formats known to format_lines()
+formats = ('csv', 'tsv', 'jsonl')
+
 
 def layout(config, rows, skip=0, show_hdr=True):
     '''Layout data for printing
@@ -42,64 +48,118 @@ def layout(config, rows, skip=0, show_hdr=True):
        'dick  001|  two',
        'harry 234|three']
 '''
-    # Figure out how many header lines we'll need.
-    hdrrows = config.bottom_just_titles()
-    hdrcnt = len(hdrrows)
-    # And how many fields
+    colw = layout_widths(config, rows, skip)
+    return list(layout_lines(config, colw, rows, skip, show_hdr))
+
+
+def layout_widths(config, rows, skip=0, colw=None):
+    '''Compute column widths for layout
+
+    Args:
+        config = layout Config
+        rows = list of row values to size the columns for
+        skip = number of leading fields to ignore in each row
+        colw = widths from earlier rows to widen, if any
+    Returns:
+        List of column widths
+    '''
     fldcnt = len(config.config)
     # Compute widths of title/dash/data values for
     # each column. Start with the configured
     # minimum widths, possibly increase that for
     # wider values, then impose maxw limits.
-    dashrow = [x.df for x in config.config]
-    colw = [x.minw for x in config.config]
-    config.layout_max(colw, hdrrows)
-    config.layout_max(colw, [dashrow])
-    config.layout_max(colw, rows, skip)
+    if colw is None:
+        hdrrows = config.bottom_just_titles()
+        dashrow = [x.df for x in config.config]
+        colw = [x.minw for x in config.config]
+        config.layout_max(colw, hdrrows)
+        config.layout_max(colw, [dashrow])
+    if rows:
+        config.layout_max(colw, rows, skip)
     for i in range(fldcnt):
         t = config.config[i].maxw
         if t >= 0 and t < colw[i]:
             colw[i] = config.config[i].maxw
+    return colw
+
+
+def layout_lines(config, colw, rows, skip=0, show_hdr=True):
+    '''Generate laid out lines using given column widths
+
+    Like layout(), but the column widths are supplied by the caller
+    (see layout_widths()) and the lines are generated one at a time.
+    This lets the caller print lines as the rows are produced, rather
+    than holding all rows and lines in memory at once.
+
+    Args:
+        config = layout Config
+        colw = list of column widths
+        rows = iterable of row values
+        skip = number of leading fields to ignore in each row
+        show_hdr = False to skip headers
+    Yields:
+        Formatted lines, headers first
+    '''
     # Layout headers
-    result = []
     if show_hdr:
+        hdrrows = config.bottom_just_titles()
+        render = config.compile(colw, 'h')
         for row in hdrrows:
-            line = ''
-            sep = ''
-            for i in range(fldcnt):
-                fs = config.config[i]
-                if fs.suppress:
-                    continue
-                fval = layout_field(fs.hj, fs.hf, colw[i], row[i], fs.ht)
-                line += sep + fval
-                sep = fs.hs
-            result.append(line)
+            yield render(row)
         # Layout horizontal separator line
         if config.config[0].df != '':
-            line = ''
-            sep = ''
-            for i in range(fldcnt):
-                fs = config.config[i]
-                if fs.suppress:
-                    continue
-                fval = layout_field(fs.dj, fs.df, colw[i], dashrow[i], fs.dt)
-                line += sep + fval
-                sep = fs.ds
-            result.append(line)
+            dashrow = [x.df for x in config.config]
+            yield config.compile(colw, 'd')(dashrow)
     # Layout data rows
+    render = config.compile(colw, 'r', skip)
     for row in rows:
-        line = ''
-        sep = ''
-        for i in range(fldcnt):
-            fs = config.config[i]
-            if fs.suppress:
-                continue
-            fval = layout_field(fs.rj, fs.rf, colw[i], row[skip + i], fs.rt)
-            line += sep + fval
-            sep = fs.rs
-        result.append(line)
+        yield render(row)
+
+
+def format_lines(fmt, names, rows, show_hdr=True, suppress=None):
+    '''Generate lines of rows in a machine-readable format
 
-    return result
+    Unlike layout(), nothing needs to be known about all the rows
+    before the first line is produced, so rows can be formatted and
+    output one at a time.
+
+    Args:
+        fmt = output format: csv, tsv, or jsonl
+        names = list of field names
+        rows = iterable of row values
+        show_hdr = False to omit the line of field names (csv, tsv)
+        suppress = list of flags, True for each field to leave out
+    Yields:
+        One line per row, without line terminator, preceded by a line
+        of field names for csv and tsv. For jsonl, each line is a JSON
+        object mapping field names to values.
+    '''
+    idx = [i for i in range(len(names)) if not suppress or not suppress[i]]
+    names = [names[i] for i in idx]
+    if fmt == 'jsonl':
+        import json
+        for row in rows:
+            yield json.dumps(dict(zip(names, [row[i] for i in idx])))
+        return
+    if fmt == 'tsv':
+        def line(values):
+            return '\t'.join([str(x).replace('\t', ' ').replace('\n', ' ')
+                              for x in values])
+    else:
+        import csv
+        import io
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='')
+
+        def line(values):
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow(values)
+            return buf.getvalue()
+    if show_hdr:
+        yield line(names)
+    for row in rows:
+        yield line([row[i] for i in idx])
 
 
 class Config(object):
@@ -214,6 +274,41 @@ class Config(object):
                     if hasattr(fs, key):
                         setattr(fs, key, value)
 
+    def compile(self, colw, kind='r', skip=0):
+        '''Build a function that lays out one line
+
+        Once the column widths are known, each column's justification,
+        fill, and truncation are fixed, so choose a renderer for each
+        column just once, rather than for each value.
+
+        Args:
+            colw = list of column widths
+            kind = 'h' for header lines, 'd' for the dash line, or 'r'
+                for data rows
+            skip = number of leading fields to ignore in each row
+        Returns:
+            function taking a list of field values and returning the
+            laid out line
+        '''
+        cols = []
+        sep = ''
+        for (i, fs) in enumerate(self.config):
+            if fs.suppress:
+                continue
+            if kind == 'h':
+                (just, fill, trunc, nsep) = (fs.hj, fs.hf, fs.ht, fs.hs)
+            elif kind == 'd':
+                (just, fill, trunc, nsep) = (fs.dj, fs.df, fs.dt, fs.ds)
+            else:
+                (just, fill, trunc, nsep) = (fs.rj, fs.rf, fs.rt, fs.rs)
+            cols.append((i + skip, sep,
+                         field_renderer(just, fill, colw[i], trunc)))
+            sep = nsep
+
+        def render(row):
+            return ''.join([sep + func(row[i]) for (i, sep, func) in cols])
+        return render
+
     def bottom_just_titles(self):
         '''Bottom justify titles
 
@@ -243,6 +338,8 @@ class Config(object):
     def layout_max(self, colw, rows, skip=0):
         '''Compute max widths needed for each column
 
+        Suppressed fields are not displayed, so they are not measured.
+
         Args:
             colw = list to contain column widths
             rows = list of lists of column values
@@ -253,8 +350,10 @@ class Config(object):
         fldcnt = len(rows[0])
         for i in range(len(colw), fldcnt):
             colw.append(0)
+        shown = [i for i in range(fldcnt)
+                 if i >= len(self.config) or not self.config[i].suppress]
         for row in rows:
-            for i in range(fldcnt):
+            for i in shown:
                 t = len(row[i + skip])
                 if t > colw[i]:
                     colw[i] = t
@@ -272,109 +371,140 @@ def layout_field(just, fill, width, value, trunc=None):
     Returns:
         string with value laid out
     '''
-    def leftmost(s, n, e=None):
-        '''Take leftmost characters of string
+    return field_renderer(just, fill, width, trunc)(value)
 
-        Args:
-            s = the string
-            n = the max number of characters
-            e = elipses string to indicate truncated field
-        Returns:
-            leftmost part of s
-        '''
-        if len(s) <= n:
-            return s
-        if not e:
-            return s[0:n]
-        if len(e) > n:
-            e = e[0:n]
-        return s[0:n - len(e)] + e
-
-    def rightmost(s, n, e=None):
-        if len(s) <= n:
-            return s
-        if not e:
-            return s[len(s) - n:]
-        if len(e) > n:
-            e = e[len(e) - n:]
-        return e + s[len(s) - n + len(e):]
-
-    def centermost(s, n, e=None):
-        '''Return n characters from center of string'''
-        sl = len(s)
-        if n >= sl:
-            return s
-        if not e:
-            first = (sl - n) // 2
-            last = first + n
-            return s[first:last]
-        if n < 2 * len(e):
-            s = e + e
-            sl = len(s)
-            first = (sl - n) // 2
-            last = first + n
-            return s[first:last]
-        first = (sl - n) // 2 + len(e)
-        last = first + n - 2 * len(e)
-        return e + s[first:last] + e
-
-    def endmost(s, n, e=None):
-        '''Return n characters from ends of string'''
-        sl = len(s)
-        if n >= sl:
-            return s
-        if not e:
-            half = n // 2
-            return s[0:half] + s[sl - (n - half):]
-        el = len(e)
-        half = (n - el) // 2
-        return s[0:half] + e + s[sl - (n - half) + el:]
 
+def field_renderer(just, fill, width, trunc=None):
+    '''Build a function that lays out values for one column
+
+    Args:
+        just = justification (l, r, c, e, or lr)
+        fill = fill character/string
+        width = field width to justify within
+        trunc = truncation character/string
+    Returns:
+        function taking a text value and returning it laid out, as
+        layout_field() does
+    '''
     if width == 0:
-        return ''
-    # Determine how much fill is needed
-    vlen = len(value)
-    if (fill == ''):
-        fill = ' '              # Protect from empty fill
-    fplen = len(fill)           # Len of fill pattern
-    flen = width - vlen         # Amount of fill needed
+        return lambda value: ''
     # Convert lr justification to either l or r based on value
     if just == 'lr':
-        just = 'r' if value.startswith(' ') else 'l'
-    # Set left fill, right fill and value
-    if flen < 0:
-        # No fill needed
-        lfill = ''
-        rfill = ''
-        if just == 'l':
-            result = leftmost(value, width, trunc)
-        elif just == 'r':
-            result = rightmost(value, width, trunc)
-        elif just == 'c':
-            result = centermost(value, width, trunc)
-        elif just == 'e':
-            result = endmost(value, width, trunc)
+        lfunc = field_renderer('l', fill, width, trunc)
+        rfunc = field_renderer('r', fill, width, trunc)
+        return lambda value: rfunc(value) if value.startswith(' ') \
+            else lfunc(value)
+    if (fill == ''):
+        fill = ' '              # Protect from empty fill
+    # Enough fill for the widest gap. Fill is aligned with the value:
+    # left fill starts with the start of the pattern, right fill ends
+    # with the end of the pattern.
+    filler = fill * ((width + len(fill) - 1) // len(fill))
+    fw = len(filler)
+    if just == 'r':
+        if trunc:
+            e = trunc[len(trunc) - width:] if len(trunc) > width else trunc
+            keep = width - len(e)
+
+            def cut(value):
+                return e + value[len(value) - keep:]
         else:
-            result = leftmost(value, width, trunc)
-    else:
-        result = value
-        flm1 = flen - 1
-        reps = (flen + fplen - 1) // fplen
-        filler = fill * reps
-        if just == 'l':
-            lfill = ''
-            rfill = rightmost(filler, flen)
-        elif just == 'r':
-            lfill = leftmost(filler, flen)
-            rfill = ''
-        elif just == 'c':
+            def cut(value):
+                return value[len(value) - width:]
+        if len(fill) == 1:
+            return lambda value: value.rjust(width, fill) \
+                if len(value) <= width else cut(value)
+        return lambda value: filler[:width - len(value)] + value \
+            if len(value) <= width else cut(value)
+    if just == 'c':
+        def cfunc(value):
+            flen = width - len(value)
+            if flen < 0:
+                return centermost(value, width, trunc)
             halff = flen // 2
-            lfill = leftmost(filler, halff)
-            rfill = rightmost(filler, flen - halff)
-        else:
-            lfill = ''
-            rfill = rightmost(filler, flen)
-    return lfill + result + rfill
+            return filler[:halff] + value + filler[fw - (flen - halff):]
+        return cfunc
+    # Anything else is left justified
+    if just == 'e':
+        def cut(value):
+            return endmost(value, width, trunc)
+    elif trunc:
+        e = trunc[:width]
+        keep = width - len(e)
+
+        def cut(value):
+            return value[:keep] + e
+    else:
+        def cut(value):
+            return value[:width]
+    if len(fill) == 1:
+        return lambda value: value.ljust(width, fill) \
+            if len(value) <= width else cut(value)
+    return lambda value: value + filler[fw - (width - len(value)):] \
+        if len(value) <= width else cut(value)
+
+
+def leftmost(s, n, e=None):
+    '''Take leftmost characters of string
+
+    Args:
+        s = the string
+        n = the max number of characters
+        e = elipses string to indicate truncated field
+    Returns:
+        leftmost part of s
+    '''
+    if len(s) <= n:
+        return s
+    if not e:
+        return s[0:n]
+    if len(e) > n:
+        e = e[0:n]
+    return s[0:n - len(e)] + e
+
+
+def rightmost(s, n, e=None):
+    '''Take rightmost characters of string'''
+    if len(s) <= n:
+        return s
+    if not e:
+        return s[len(s) - n:]
+    if len(e) > n:
+        e = e[len(e) - n:]
+    return e + s[len(s) - n + len(e):]
+
+
+def centermost(s, n, e=None):
+    '''Return n characters from center of string'''
+    sl = len(s)
+    if n >= sl:
+        return s
+    if not e:
+        first = (sl - n) // 2
+        last = first + n
+        return s[first:last]
+    if n < 2 * len(e):
+        s = e + e
+        sl = len(s)
+        first = (sl - n) // 2
+        last = first + n
+        return s[first:last]
+    first = (sl - n) // 2 + len(e)
+    last = first + n - 2 * len(e)
+    return e + s[first:last] + e
+
+
+def endmost(s, n, e=None):
+    '''Return n characters from ends of string'''
+    sl = len(s)
+    if n >= sl:
+        return s
+    if not e:
+        half = n // 2
+        return s[0:half] + s[sl - (n - half):]
+    el = len(e)
+    half = (n - el) // 2
+    return s[0:half] + e + s[sl - (n - half) + el:]
 
 
 def test():
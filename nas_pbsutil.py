@@ -4,16 +4,20 @@ Miscellaneous routines to interact with PBS
 
 import re
 import pbs_ifl as ifl
+import marshal
+import mmap
 import os
-import socket
 import stat
+import struct
 import sys
+import threading
 import time
-import json
 
 import nas_xstat_config as conf
+from nas_field_format import epoch_strftime
 import pbs_ifl as ifl
 from collections import OrderedDict
+from collections.abc import MutableMapping
 
 pbs_conf = ifl.cvar.pbs_conf
 
@@ -53,6 +57,7 @@ def get_server(job_id):
             if s == t:
                 job_id_out = job_id_out + '.' + pbs_server_name
                 return (job_id_out, server_out)
+            import socket
             try:
                 (hname, alias, ipaddr) = socket.gethostbyname_ex(parent_server)
                 parent_server = hname
@@ -115,7 +120,7 @@ def parse_jobid(job_id):
     return (seq_num, parent, current, array_idx, resv_type)
 
 
-def file_to_stat(host, stat, attrs=[]):
+def file_to_stat(host, stat, attrs=[], names=None):
     '''Load faked PBS statXXX results from file
 
     That is, check if one of the --debug arguments specified a file
@@ -125,36 +130,78 @@ def file_to_stat(host, stat, attrs=[]):
     E.g., You might take the output from pbsnodes -av and convert it
     to look like the result from a pbs_statvnodes() call.
 
+    A snapshot from --debug fake_snapshot is checked first. It is
+    served straight from the file, without parsing.
+
     Args:
         host = Hostname of faked data of interest
         stat = Which kind of info is being queried (e.g., jobs)
         attrs = List of interesting attribute names. Can also
             be the attropl that would be passed to the pbs_xyz call.
+        names = List of object names to limit a snapshot's results to.
+            Ignored for other fake files, which are returned whole.
     Returns:
         None if there isn't any appropriate fake file specified.
         Else a dictionary with the attributes and values.
     '''
+    snap = snapshot_given()
+    if snap is not None:
+        bs = snap.stat(host, stat, attrl_to_list(attrs), names)
+        if bs is not None:
+            return bs
     mo = re.search(r'fake_%s_%s=([^\s]+)' % (stat, host), conf.gdebug)
     if not mo:
         return None
     fname = mo.group(1)
-    # Convert attropl to simple list if necessary
-    lst = None
-    if isinstance(attrs, ifl.attropl) or isinstance(attrs, ifl.attrl):
-        lst = []
-        cur = attrs
-        while cur:
-            key = cur.name
-            if cur.resource:
-                key = key + '.' + cur.resource
-            lst.append(key)
-            cur = cur.next
     with open(fname) as fd:
-        lines = fd.read()
-        bs = lines_to_stat(lines, attrs if lst is None else lst)
+        bs = list(iter_stat(fd, attrl_to_list(attrs)))
     return bs
 
 
+def attrl_to_list(attrs):
+    '''Convert attrl or attropl to a list of attribute names
+
+    Args:
+        attrs = attrl, attropl, or something already list-like
+    Returns:
+        List of names, in the form attr or attr.resource,
+        or attrs unchanged if it is not an attrl/attropl.
+    '''
+    if not (isinstance(attrs, ifl.attropl) or isinstance(attrs, ifl.attrl)):
+        return attrs
+    lst = []
+    cur = attrs
+    while cur:
+        key = cur.name
+        if cur.resource:
+            key = key + '.' + cur.resource
+        lst.append(key)
+        cur = cur.next
+    return lst
+
+
+def attropl_to_dict(attrs):
+    '''Convert attropl to a dict of attribute names and values
+
+    Args:
+        attrs = attropl, or something already dict-like
+    Returns:
+        dict mapping names, in the form attr or attr.resource, to values,
+        or attrs unchanged if it is not an attropl.
+    '''
+    if not isinstance(attrs, ifl.attropl):
+        return attrs
+    d = dict()
+    cur = attrs
+    while cur:
+        key = cur.name
+        if cur.resource:
+            key = key + '.' + cur.resource
+        d[key] = cur.value
+        cur = cur.next
+    return d
+
+
 def lines_to_stat(lines, attrs=[]):
     '''Convert file contents to PBS statXXX result
 
@@ -164,57 +211,1023 @@ def lines_to_stat(lines, attrs=[]):
     Returns:
         List of dicts with attribute/value pairs
     '''
-    item_list = []
+    return list(iter_stat(lines, attrs))
+
+
+def iter_stat(src, attrs=None):
+    '''Parse PBS statXXX results, one item at a time
+
+    The text looks like qstat -f or pbsnodes -av output: a line with
+    the item ID, possibly preceded by, e.g., 'Job Id: ', then
+    "name = value" lines, with a blank line after each item.
+
+    Args:
+        src = Contents of file, or file object to read a piece at a time
+        attrs = Names of interesting attributes, None or empty for all
+    Yields:
+        Dict with attribute/value pairs for each item
+    '''
+    attrset = set(attrs or [])
+    # Map from attribute name as it appears in the text to the stripped
+    # name, or to False if the attribute is not interesting.
+    names = dict()
     item = None
-    line_cnt = 0
-    attrset = set(attrs)
-    for line in lines.split('\n'):
-        line_cnt += 1
-        if line == '':
-            if item:
-                item_list.append(item)
-            item = None
-            continue
-        if '=' not in line:
-            if item:    # Should not happen
-                item_list.append(item)
-            # New item
-            item = dict()
-            # First line of an item has the item ID, possibly
-            # preceded by, e.g., 'Job: ' or 'Resv ID: '.
-            item['id'] = line.split(':')[-1].strip()
-            continue
-        flds = line.split('=', 1)
-        if len(flds) != 2:
-            print("Garbage input at line %d: %s" % (line_cnt, line),
-                  file=sys.stderr)
-            continue
-        key = flds[0].strip()
-        if (attrset and key.split('.')[0] not in attrset):
-            continue
-        value = flds[1].strip()
-        # Hack to recognize epoch + timestamp and convert to just epoch
-        # E.g., 1624104854 (Sat Jun 19 05:14:14 PDT 2021)
-        mo = re.match(r'(\d{9,15}) \(', value)
-        if mo:
-            value = mo.group(1)
-        item[key] = value
+    for lines in text_pieces(src):
+        for line in lines:
+            if line == '':
+                if item:
+                    yield item
+                item = None
+                continue
+            (key, sep, value) = line.partition('=')
+            if not sep:
+                if item:    # Should not happen
+                    yield item
+                # New item
+                # First line of an item has the item ID, possibly
+                # preceded by, e.g., 'Job: ' or 'Resv ID: '.
+                item = {'id': line.rpartition(':')[2].strip()}
+                continue
+            name = names.get(key)
+            if name is None:
+                name = key.strip()
+                if (attrset and name not in attrset and
+                        name.split('.')[0] not in attrset):
+                    name = False
+                names[key] = name
+            if name is False or item is None:
+                continue
+            value = value.strip()
+            # Recognize epoch + timestamp and convert to just epoch
+            # E.g., 1624104854 (Sat Jun 19 05:14:14 PDT 2021)
+            if value[:1].isdecimal():
+                i = value.find(' (')
+                if 9 <= i <= 15 and value[:i].isdecimal():
+                    value = value[:i]
+            item[name] = value
     if item:
-        item_list.append(item)
-    return item_list
+        yield item
 
 
-def load_userexits(prefix):
-    '''Load text of userexit overrides
+def text_pieces(src, size=1 << 20):
+    '''Split text into lists of lines, reading files a piece at a time
+
+    Args:
+        src = string, or file object open for reading text
+        size = number of characters to read at once
+    Yields:
+        lists of lines, without line ends
+    '''
+    if isinstance(src, str):
+        yield src.split('\n')
+        return
+    rest = ''
+    while True:
+        buf = src.read(size)
+        if not buf:
+            break
+        lines = (rest + buf).split('\n')
+        rest = lines.pop()
+        yield lines
+    yield [rest]
+
+
+class ColumnRow(MutableMapping):
+    '''One object's view of a columnar batch status
+
+    Behaves like the dict the normal pbs_statxxx() wrappers return
+    for the object, but the values live in shared per-attribute lists.
+    '''
+    __slots__ = ('_cols', '_idx')
+
+    def __init__(self, cols, idx):
+        self._cols = cols
+        self._idx = idx
+
+    def __getitem__(self, key):
+        v = self._cols[key][self._idx]
+        if v is None:
+            raise KeyError(key)
+        return v
+
+    def get(self, key, default=None):
+        col = self._cols.get(key)
+        if col is None:
+            return default
+        v = col[self._idx]
+        return default if v is None else v
+
+    def __contains__(self, key):
+        col = self._cols.get(key)
+        return col is not None and col[self._idx] is not None
+
+    def __setitem__(self, key, value):
+        col = self._cols.get(key)
+        if col is None:
+            col = self._cols[key] = [None] * len(self._cols['id'])
+        col[self._idx] = value
+
+    def __delitem__(self, key):
+        col = self._cols.get(key)
+        if col is None or col[self._idx] is None:
+            raise KeyError(key)
+        col[self._idx] = None
+
+    def __iter__(self):
+        idx = self._idx
+        for (key, col) in self._cols.items():
+            if col[idx] is not None:
+                yield key
+
+    def __len__(self):
+        idx = self._idx
+        return sum(1 for col in self._cols.values() if col[idx] is not None)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class OrderedColumnRow(ColumnRow):
+    '''A ColumnRow that lists its attributes in a given order
+
+    Plain ColumnRows list attributes in column order, which is the same
+    for every object. Rows replayed from a snapshot instead list them in
+    the order the server sent them for that object.
+    '''
+    __slots__ = ('_order',)
+
+    def __init__(self, cols, idx, order):
+        super().__init__(cols, idx)
+        self._order = order
+
+    def __iter__(self):
+        idx = self._idx
+        cols = self._cols
+        (keys, keyset) = self._order
+        for key in keys:
+            col = cols.get(key)
+            if col is not None and col[idx] is not None:
+                yield key
+        # Then any attributes added since
+        for (key, col) in cols.items():
+            if key not in keyset and col[idx] is not None:
+                yield key
+
+
+def columns_to_stat(ids, cols, orders=None):
+    '''Convert a columnar PBS statXXX result to a list of row views
+
+    Args:
+        ids = list of object names
+        cols = dict mapping attribute names to lists of values
+        orders = list, parallel to ids, of each object's attribute
+            names in order, or None to use column order for all.
+            Objects with the same order should share the same list.
+    Returns:
+        List of ColumnRow objects, one per object, usable wherever
+        the dicts from pbs_statxxx() are.
+    '''
+    t = {'id': ids}
+    t.update(cols)
+    if orders is None:
+        return [ColumnRow(t, i) for i in range(len(ids))]
+    shared = dict()
+    rows = []
+    for (i, keys) in enumerate(orders):
+        order = shared.get(id(keys))
+        if order is None:
+            order = shared[id(keys)] = (['id'] + list(keys),
+                                        frozenset(keys) | {'id'})
+        rows.append(OrderedColumnRow(t, i, order))
+    return rows
+
+
+_lazy_deleted = object()
+_lazy_unset = object()
+
+
+class LazyRow(MutableMapping):
+    '''One object's view of a lazy batch status
+
+    Behaves like the dict the normal pbs_statxxx() wrappers return
+    for the object, but attribute values stay in the C batch_status
+    until first looked up. Decoded and assigned values are kept in
+    a small per-row dict.
+    '''
+    __slots__ = ('_cap', '_idx', '_vals')
+
+    def __init__(self, cap, idx):
+        self._cap = cap
+        self._idx = idx
+        self._vals = None
+
+    def get(self, key, default=None):
+        vals = self._vals
+        if vals is None:
+            vals = self._vals = {'id': ifl.lazy_bs_name(self._cap, self._idx)}
+        v = vals.get(key, _lazy_unset)
+        if v is _lazy_unset:
+            v = ifl.lazy_bs_get(self._cap, self._idx, key)
+            if v is None:
+                v = _lazy_deleted
+            vals[key] = v
+        if v is _lazy_deleted:
+            return default
+        return v
+
+    def __getitem__(self, key):
+        v = self.get(key, _lazy_deleted)
+        if v is _lazy_deleted:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key):
+        return self.get(key, _lazy_deleted) is not _lazy_deleted
+
+    def __setitem__(self, key, value):
+        self.get(key)
+        self._vals[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._vals[key] = _lazy_deleted
+
+    def __iter__(self):
+        self.get('id')
+        vals = self._vals
+        keys = ['id']
+        keys.extend(ifl.lazy_bs_keys(self._cap, self._idx))
+        seen = set(keys)
+        keys.extend(k for k in vals if k not in seen)
+        for key in keys:
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def lazy_to_stat(cap):
+    '''Convert a lazy PBS statXXX result to a list of row views
+
+    Args:
+        cap = capsule from pbs_statjob_lazy() or similar
+    Returns:
+        List of LazyRow objects, one per object, usable wherever
+        the dicts from pbs_statxxx() are. The underlying batch_status
+        is freed once all the rows are discarded.
+    '''
+    return [LazyRow(cap, i) for i in range(ifl.lazy_bs_count(cap))]
+
+
+qstatd_default_socket = '/var/run/nas_qstatd/socket'
+
+
+def qstatd_socket():
+    '''Locate the nas_qstatd socket
+
+    Returns:
+        Path to the socket, or '' if use of nas_qstatd is disabled.
+        The socket is found via conf.qstatd_socket (set by -W qstatd=),
+        then the NAS_QSTATD_SOCKET environment variable, then the
+        compiled-in default.
+    '''
+    path = conf.qstatd_socket
+    if path is None:
+        path = os.environ.get('NAS_QSTATD_SOCKET', qstatd_default_socket)
+    if path.lower() in ('f', 'false', '0'):
+        return ''
+    return path
+
+
+def qstatd_to_stat(host, what, attrs=None, select=None, extend='',
+                   names=None):
+    '''Fetch PBS statXXX results from nas_qstatd
+
+    Like file_to_stat(), this provides a substitute for an actual
+    pbs_statxyz call, in this case from the cache kept by a local
+    nas_qstatd daemon. The daemon does the projection and filtering
+    that the PBS server would have done.
+
+    Args:
+        host = Name of server of interest
+        what = Which kind of info is wanted: jobs, server, queues,
+            vnodes, or resvs
+        attrs = List of interesting attribute names, or an attrl.
+            None or empty means all attributes.
+        select = Selection criteria, as dict or attropl (jobs only)
+        extend = Extend flags, as for pbs_statjob (jobs only)
+        names = List of ids or queue names to limit results to
+    Returns:
+        None if the daemon is not running, not trustworthy, does not
+        have data for host, or has data older than conf.qstatd_max_age.
+        Else a list of dicts with the attributes and values.
+    '''
+    path = qstatd_socket()
+    if not path:
+        return None
+    # Only believe sockets created by root, ourselves, or the account
+    # the site runs nas_qstatd as
+    try:
+        sbuf = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(sbuf.st_mode):
+        return None
+    if sbuf.st_uid != 0 and sbuf.st_uid != os.getuid():
+        if not conf.qstatd_user:
+            return None
+        import pwd
+        try:
+            if sbuf.st_uid != pwd.getpwnam(conf.qstatd_user).pw_uid:
+                return None
+        except KeyError:
+            return None
+    import json
+    import socket
+    req = {
+        'server': host.split('.')[0],
+        'stat': what,
+        'attrs': attrl_to_list(attrs) or None,
+        'select': attropl_to_dict(select) or None,
+        'extend': extend or '',
+        'names': names or None,
+        'max_age': conf.qstatd_max_age,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(conf.qstatd_timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(req).encode() + b'\n')
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile('rb') as fd:
+                hdr = json.loads(fd.readline())
+                if not hdr.get('ok'):
+                    return None
+                age = time.time() - hdr.get('time', 0)
+                if age > conf.qstatd_max_age:
+                    return None
+                bs = [json.loads(line) for line in fd]
+    except (OSError, ValueError):
+        return None
+    if len(bs) != hdr.get('count'):
+        # Truncated reply
+        return None
+    return bs
+
+
+cache_magic = b'NQC1'
+cache_hdr = struct.Struct('=4sd')
+
+
+def cache_dir(create=False):
+    '''Locate (and create) the user's private status cache directory
+
+    Args:
+        create = True to create the directory if it is missing. Readers
+            leave this False, so users who never write to the cache do
+            not get an empty directory.
+    Returns:
+        Path to directory, or None if it is missing and cannot be (or
+        is not to be) created, or is not a directory owned by us and
+        closed to others.
+    '''
+    home = os.environ.get('HOME')
+    if not home:
+        home = os.path.expanduser('~')
+    path = os.path.join(home, '.cache', 'nas_qstat')
+    try:
+        if create:
+            os.makedirs(path, 0o700, exist_ok=True)
+        sbuf = os.lstat(path)
+    except OSError:
+        return None
+    # Be careful about what we trust
+    if not stat.S_ISDIR(sbuf.st_mode) or sbuf.st_uid != os.getuid():
+        return None
+    if stat.S_IMODE(sbuf.st_mode) & (stat.S_IRWXG | stat.S_IRWXO):
+        return None
+    return path
+
+
+def cache_path(key, create=False):
+    '''Compute file name for cache entry
+
+    Args:
+        key = tuple identifying the query (what, server, attributes, ...)
+        create = True to create the cache directory if needed, as when
+            about to write the entry
+    Returns:
+        Path to cache file, or None if caching is unavailable
+    '''
+    cdir = cache_dir(create)
+    if cdir is None:
+        return None
+    import hashlib
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(cdir, '%s-%s' % (key[0], digest))
+
+
+def cache_open(path):
+    '''Open a cache file for reading, if it is trustworthy
+
+    Args:
+        path = path to cache file
+    Returns:
+        (fd, stat result) tuple. fd is None if the file does not exist,
+        or is not a regular file owned by us and closed to others.
+    '''
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return (None, None)
+    try:
+        sbuf = os.fstat(fd)
+    except OSError:
+        sbuf = None
+    if sbuf is None or not stat.S_ISREG(sbuf.st_mode) or \
+            sbuf.st_uid != os.getuid() or \
+            stat.S_IMODE(sbuf.st_mode) & (stat.S_IRWXG | stat.S_IRWXO):
+        os.close(fd)
+        return (None, None)
+    return (fd, sbuf)
+
+
+def cache_load(key):
+    '''Look up PBS statXXX results in the per-user cache
+
+    Entries expire after conf.cache_ttl seconds.
+
+    Args:
+        key = tuple identifying the query (what, server, attributes, ...)
+    Returns:
+        List of dicts, as from pbs_statxxx(), or None on a cache miss.
+    '''
+    if conf.cache_ttl <= 0:
+        return None
+    path = cache_path(key)
+    if path is None:
+        return None
+    (fd, sbuf) = cache_open(path)
+    if fd is None:
+        return None
+    try:
+        if sbuf.st_size <= cache_hdr.size:
+            return None
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            (magic, when) = cache_hdr.unpack_from(mm)
+            if magic != cache_magic:
+                return None
+            if time.time() - when > conf.cache_ttl:
+                return None
+            with memoryview(mm) as mv, mv[cache_hdr.size:] as body:
+                bs = marshal.loads(body)
+    except (OSError, ValueError, EOFError, TypeError, BufferError):
+        return None
+    finally:
+        os.close(fd)
+    return bs
+
+
+def cache_store(key, bs):
+    '''Save PBS statXXX results in the per-user cache
+
+    The results are saved as marshal data, with attribute names interned
+    so each is stored only once per file.
+
+    Args:
+        key = tuple identifying the query (what, server, attributes, ...)
+        bs = List of dicts (or dict-like items), as from pbs_statxxx()
+    '''
+    if conf.cache_ttl <= 0 or not bs:
+        # Caching disabled, or nothing worth caching (perhaps an error)
+        return
+    path = cache_path(key, True)
+    if path is None:
+        return
+    intern = sys.intern
+    items = [{intern(k): v for (k, v) in item.items()} for item in bs]
+    try:
+        data = cache_hdr.pack(cache_magic, time.time()) + \
+            marshal.dumps(items)
+    except ValueError:
+        # Something unexpected in the results
+        return
+    cache_write(path, data)
+
+
+def cache_write(path, data):
+    '''Replace the contents of a cache file
+
+    Args:
+        path = path to cache file
+        data = bytes to store
+    '''
+    # Write to temp file, then rename, so readers never see partial data
+    tmp = '%s.%d' % (path, os.getpid())
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                     os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+# Routines for --debug record and --debug fake_snapshot
+#
+# A snapshot file holds the results of pbs_statxxx() calls, so they can
+# be replayed later in place of a server. The file is laid out as:
+#   header: magic, version, status time, offset and length of the
+#       table of contents
+#   data: for each (host, stat) section, the object names, and for
+#       each attribute, a table of its distinct values plus an array
+#       with one index into the table per object. Index 0 means the
+#       object does not have the attribute. Tables are UTF-8 strings
+#       separated by NULs; arrays are 1, 2, or 4 byte unsigned ints.
+#   table of contents: marshal data locating each section's pieces
+# The object names are kept in the order recorded, so they also serve
+# as the index of the section's rows. Each section also has a list of
+# the distinct attribute orders of its objects, kept in the table of
+# contents, plus an array giving each object's entry in that list, so
+# replayed objects list their attributes as the server sent them.
+
+snap_magic = b'NQSS'
+snap_version = 1
+snap_hdr = struct.Struct('<4sHxxdQQ')
+gRecorder = None
+gSnapshots = dict()
+
+
+class SnapshotRecorder(object):
+    '''Collect pbs_statxxx() results to write to a snapshot file
+
+    Results for the same host and stat are merged by object name, so
+    repeated queries for different attributes add to the same rows.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.sections = dict()
+
+    def add(self, host, stat, bs):
+        '''Add the results of one pbs_statxxx() call
+
+        Args:
+            host = server name
+            stat = Which kind of info (e.g., jobs)
+            bs = list of dicts (or dict-like items)
+        '''
+        items = self.sections.setdefault((host.split('.')[0], stat), dict())
+        for item in bs:
+            name = item.get('id')
+            if name is None:
+                continue
+            t = items.get(name)
+            if t is None:
+                t = items[name] = dict()
+            for (key, value) in item.items():
+                if key != 'id' and isinstance(value, str):
+                    t.setdefault(key, value)
+
+    def encode(self, when):
+        '''Build the contents of the snapshot file
+
+        Args:
+            when = time the status is as of
+        Returns:
+            bytes to write to the file
+        '''
+        import array
+        chunks = [b'']
+        off = snap_hdr.size
+
+        def put(data):
+            nonlocal off
+            pos = off
+            chunks.append(data)
+            off += len(data)
+            pad = -off % 4
+            if pad:
+                chunks.append(bytes(pad))
+                off += pad
+            return pos
+
+        sections = dict()
+        for (sect, items) in self.sections.items():
+            ids = list(items)
+            blob = '\0'.join(ids).encode()
+            keys = dict()
+            orders = {(): 0}
+            for item in items.values():
+                keys.update(dict.fromkeys(item))
+                orders.setdefault(tuple(item), len(orders))
+            order_idx = [orders[tuple(item)] for item in items.values()]
+            cols = dict()
+            for key in keys:
+                table = {None: 0}
+                idx = [table.setdefault(item.get(key), len(table))
+                       for item in items.values()]
+                code = 'B' if len(table) <= 0x100 else \
+                    'H' if len(table) <= 0x10000 else 'I'
+                values = '\0'.join(list(table)[1:]).encode()
+                cols[key] = (put(values), len(values),
+                             put(array.array(code, idx).tobytes()), code)
+            code = 'B' if len(orders) <= 0x100 else \
+                'H' if len(orders) <= 0x10000 else 'I'
+            sections[sect] = {'count': len(ids), 'ids': (put(blob), len(blob)),
+                              'cols': cols,
+                              'orders': (tuple(orders), put(array.array(
+                                  code, order_idx).tobytes()), code)}
+        toc = marshal.dumps({'byteorder': sys.byteorder,
+                             'sections': sections})
+        chunks[0] = snap_hdr.pack(snap_magic, snap_version, when, off,
+                                  len(toc))
+        chunks.append(toc)
+        return b''.join(chunks)
+
+    def write(self, when):
+        '''Write the snapshot file
+
+        Args:
+            when = time the status is as of
+        '''
+        tmp = '%s.%d' % (self.path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(self.encode(when))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print('Cannot write snapshot to %s: %s' % (self.path, e),
+                  file=sys.stderr)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+class Snapshot(object):
+    '''Read access to a snapshot file written by SnapshotRecorder
+
+    The file is mapped into memory, and only the attributes asked for
+    are decoded.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < snap_hdr.size:
+            raise ValueError('%s: not a snapshot' % path)
+        (magic, version, self.when, toc_off, toc_len) = \
+            snap_hdr.unpack_from(self.mm)
+        if magic != snap_magic or version != snap_version:
+            raise ValueError('%s: not a version %d snapshot' %
+                             (path, snap_version))
+        toc = marshal.loads(self.mm[toc_off:toc_off + toc_len])
+        self.swap = toc['byteorder'] != sys.byteorder
+        self.sections = toc['sections']
+
+    def strings(self, off, size):
+        '''Get a table of strings'''
+        return self.mm[off:off + size].decode().split('\0')
+
+    def stat(self, host, stat, attrs=None, names=None):
+        '''Get the recorded results for a pbs_statxxx() call
+
+        Args:
+            host = server name
+            stat = Which kind of info (e.g., jobs)
+            attrs = list of interesting attribute names, None or empty
+                for all. As for lines_to_stat(), a name without a
+                resource matches all of its resources.
+            names = list of object names to select, None for all.
+                Matched on the part before the first '.', so job ids
+                need not include the server.
+        Returns:
+            None if the snapshot has no results for host and stat.
+            Else a list of ColumnRow objects.
+        '''
+        import array
+        sect = self.sections.get((host.split('.')[0], stat))
+        if sect is None:
+            return None
+        count = sect['count']
+        ids = self.strings(*sect['ids']) if count else []
+        rows = None
+        if names:
+            index = {x.split('.')[0]: i for (i, x) in enumerate(ids)}
+            rows = [index[x] for x in [n.split('.')[0] for n in names]
+                    if x in index]
+            ids = [ids[i] for i in rows]
+        want = set(attrs) if attrs else None
+
+        def index(ioff, code):
+            idx = array.array(code)
+            idx.frombytes(self.mm[ioff:ioff + count * idx.itemsize])
+            if self.swap:
+                idx.byteswap()
+            if rows is not None:
+                idx = [idx[i] for i in rows]
+            return idx
+
+        cols = dict()
+        for (key, (soff, slen, ioff, code)) in sect['cols'].items():
+            if want is not None and key not in want and \
+                    key.split('.')[0] not in want:
+                continue
+            table = [None]
+            table.extend(self.strings(soff, slen))
+            cols[sys.intern(key)] = list(map(table.__getitem__,
+                                             index(ioff, code)))
+        orders = None
+        if 'orders' in sect:
+            (table, ioff, code) = sect['orders']
+            orders = list(map(table.__getitem__, index(ioff, code)))
+        return columns_to_stat(ids, cols, orders)
+
+
+def record_start(path):
+    '''Start recording status results, for --debug record
+
+    Args:
+        path = snapshot file to write at record_finish()
+    '''
+    global gRecorder
+    gRecorder = SnapshotRecorder(path)
+
+
+def record_stat(host, stat, bs):
+    '''Add pbs_statxxx() results to the snapshot, if recording
+
+    Args:
+        host = server name
+        stat = Which kind of info (e.g., jobs)
+        bs = list of dicts (or dict-like items), or None
+    '''
+    if gRecorder is not None and bs:
+        gRecorder.add(host, stat, bs)
+
+
+def record_finish():
+    '''Write the snapshot and stop recording, if --debug record is active'''
+    global gRecorder
+    if gRecorder is not None:
+        gRecorder.write(conf.gNow or time.time())
+        gRecorder = None
+
+
+def snapshot_given():
+    '''Open the snapshot named by --debug fake_snapshot, if any
+
+    Returns:
+        Snapshot object, or None if there is no fake_snapshot argument
+    '''
+    mo = re.search(r'\bfake_snapshot=(\S+)', conf.gdebug)
+    if not mo:
+        return None
+    path = mo.group(1)
+    snap = gSnapshots.get(path)
+    if snap is None:
+        snap = gSnapshots[path] = Snapshot(path)
+    return snap
+
+
+def snapshot_time():
+    '''Get the time replayed status is as of
+
+    Returns:
+        Time the --debug fake_snapshot file was recorded, or None
+    '''
+    snap = snapshot_given()
+    return None if snap is None else snap.when
+
+
+# Routines for the NAS scheduler's sortedjobs file
+#
+# Job lines have the form (tab-separated):
+#   jobid queue user share_name starve est_start priority ncpus
+# and are in the order the scheduler sorted the jobs. Lines starting
+# with #A describe share entities (see parse_share_line()). Other lines
+# starting with # are comments.
+
+sortedjobs_magic = b'NQI1'
+
+
+class SortedJobs(object):
+    '''Indexed view of a sortedjobs file
+
+    One pass over a memory map of the file finds the offset of each
+    job's line and its position in the sort, and parses the share entity
+    lines. With -W cache_ttl, the result is kept in the per-user cache
+    and reused until the file's mtime or size changes. Job lines are
+    read from the map only when looked up.
+    '''
+
+    def __init__(self, fd, path):
+        sbuf = os.fstat(fd)
+        if sbuf.st_size > 0:
+            self.mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = b''
+        stamp = (sbuf.st_mtime_ns, sbuf.st_size)
+        key = ('sortedjobs', os.path.abspath(path))
+        t = self.cache_load(key, stamp)
+        if t is None:
+            t = self.build()
+            self.cache_store(key, stamp, t)
+        (self.index, self.offsets, self.shares, self.problems) = t
+
+    def build(self):
+        '''Scan the file for job lines and share entities
+
+        Returns:
+            (index, offsets, shares, problems) tuple, where index maps
+            job id to position in the sort, offsets gives the offset of
+            the line for each position, shares maps share entity names
+            to their info, and problems lists (message, line) tuples for
+            share lines that could not be parsed.
+        '''
+        index = dict()
+        offsets = []
+        shares = dict()
+        problems = []
+        nshares = 0
+        mm = self.mm
+        size = len(mm)
+        pos = 0
+        # Step through the map a line at a time, copying out only the
+        # pieces needed
+        while pos < size:
+            end = mm.find(b'\n', pos)
+            if end < 0:
+                end = size
+            first = mm[pos:pos + 2]
+            if first == b'#A':
+                line = mm[pos:end].decode(errors='replace')
+                (key, item) = parse_share_line(line)
+                if key is None:
+                    problems.append((item, line))
+                else:
+                    item['idx'] = nshares
+                    nshares += 1
+                    shares[key] = item
+            elif end > pos and first[:1] != b'#':
+                tab = mm.find(b'\t', pos, end)
+                jobid = mm[pos:end if tab < 0 else tab].strip()
+                index[jobid.decode(errors='replace')] = len(offsets)
+                offsets.append(pos)
+            pos = end + 1
+        return (index, offsets, shares, problems)
+
+    def cache_load(self, key, stamp):
+        '''Get the results of build() from the cache, if still valid'''
+        if conf.cache_ttl <= 0:
+            return None
+        path = cache_path(key)
+        if path is None:
+            return None
+        (fd, sbuf) = cache_open(path)
+        if fd is None:
+            return None
+        try:
+            if sbuf.st_size <= len(sortedjobs_magic):
+                return None
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(sortedjobs_magic)] != sortedjobs_magic:
+                    return None
+                with memoryview(mm) as mv, \
+                        mv[len(sortedjobs_magic):] as body:
+                    (old, t) = marshal.loads(body)
+        except (OSError, ValueError, EOFError, TypeError, BufferError):
+            return None
+        finally:
+            os.close(fd)
+        return t if old == stamp else None
+
+    def cache_store(self, key, stamp, t):
+        '''Save the results of build() in the cache'''
+        if conf.cache_ttl <= 0:
+            # Only users who ask for the cache get one
+            return
+        path = cache_path(key, True)
+        if path is not None:
+            cache_write(path, sortedjobs_magic + marshal.dumps((stamp, t)))
+
+    def job_fields(self, jobid):
+        '''Look up a job's line
+
+        Args:
+            jobid = job id, as it appears in the file
+        Returns:
+            None if the job is not in the file. Else a list of the
+            line's tab-separated fields, plus the job's position in
+            the sort.
+        '''
+        idx = self.index.get(jobid)
+        if idx is None:
+            return None
+        off = self.offsets[idx]
+        end = self.mm.find(b'\n', off)
+        if end < 0:
+            end = len(self.mm)
+        flds = self.mm[off:end].decode(errors='replace').split('\t')
+        flds.append(idx)
+        return flds
+
+
+def parse_share_line(line):
+    '''Parse a share entity line from a sortedjobs file
+
+    The lines have the format (tab-separated):
+    #A     entity=[class] gross net ncpus inuse leader
+    Where entity is the mission name, or a group:user
+        gross = allocated share from shares file
+        net = gross adjusted by unavailable resources
+        ncpus = units currently in use
+        inuse = e+ed/l+ld/b+bd
+            where e = inuse, but exempt
+                l = inuse, subject to share limits
+                b = inuse, borrowed from other shares
+                d suffix = queued demands of each of the above
+        leader = base mission of allocation
+    The entry for root is special and reflects overall information.
+    Entries with gross == -1 don't have their own allocation, but use
+    the allocation given by their leader field.
+    E.g.,
+        #A              root=   520 0   2   0+0/0+0/0+0 root
+        #A               SMD=   500 500 1   0+0/0+0/0+0 SMD
+        #A               NAS=   20  20  0   0+0/0+0/1+5 NAS
+        #A dtalcott:dtalcott=   -1  0   -1  0+0/0+0/1+5 NAS
+    Args:
+        line = line from file
+    Returns:
+        (key, info) tuple, where key is the entity name, prefixed with
+        <class> if there is one, and info is a dict of the values. If
+        the line is malformed, key is None and info describes the
+        problem.
+    '''
+    flds = line[2:].split('\t')
+    if len(flds) != 6:
+        return (None, 'Malformed line in sortedjobs file:')
+    z = flds[0].split('=')
+    if len(z) != 2:
+        return (None, 'Malformed share entity in sortedjobs file:')
+    entity = z[0].strip()
+    cls = z[1].strip()
+    key = entity if cls == '' else '<' + cls + '> ' + entity
+    try:
+        gross = int(flds[1])
+        net = int(flds[2])
+        alloc = int(flds[3])
+        inuse = flds[4]
+        leader = flds[5]
+    except Exception:
+        return (None, 'Bad values in sortedjobs file:')
+    mo = re.match(r'(\d+)\+(\d+)/(\d+)\+(\d+)/(\d+)\+(\d+)$', inuse)
+    if not mo:
+        return (None, 'Bad usage in sortedjobs file:')
+    e, ed, l, ld, b, bd = mo.groups()
+    item = {'gross': gross, 'net': net, 'alloc': alloc,
+            'e': int(e), 'ed': int(ed), 'l': int(l), 'ld': int(ld),
+            'b': int(b), 'bd': int(bd),
+            'leader': leader}
+    return (key, item)
+
+
+def sortedjobs_open(path):
+    '''Open and index a sortedjobs file
+
+    Args:
+        path = path to file
+    Returns:
+        SortedJobs object, or None if the file cannot be read
+    '''
+    try:
+        with open(path, 'rb') as f:
+            return SortedJobs(f.fileno(), path)
+    except (OSError, ValueError):
+        return None
+
+
+def userexit_files(prefix):
+    '''Locate userexit files we are willing to load
 
     Args:
         prefix = prefix for userexit file name
     Returns:
-        Catenation of all userexit file contents
+        list of (path, stat result) tuples, system file first
     '''
-    code = ''
+    files = []
     user = os.getuid()
-    # Load system userexit, if present.
+    # Look for system userexit, if present.
     pbs_exec = pbs_conf.pbs_exec_path
     t = os.environ.get('NAS_QSTAT_EXEC')
     if t:
@@ -232,11 +1245,10 @@ def load_userexits(prefix):
                 if sbuf.st_uid == 0 or sbuf.st_uid == user:
                     mode = stat.S_IMODE(sbuf.st_mode)
                     if (mode & (stat.S_IWGRP | stat.S_IWOTH)) == 0:
-                        with open(path) as f:
-                            code += f.read()
+                        files.append((path, sbuf))
         except OSError:
             pass
-    # Append any user's userexit code
+    # Add any user's userexit code
     home = os.environ.get('HOME')
     if not home:
         home = os.path.expanduser('~')
@@ -251,12 +1263,77 @@ def load_userexits(prefix):
                 if sbuf.st_uid == 0 or sbuf.st_uid == user:
                     mode = stat.S_ISDIR(sbuf.st_mode)
                     if (mode & (stat.S_IWGRP | stat.S_IWOTH)) == 0:
-                        with open(path) as f:
-                            code += f.read()
+                        files.append((path, sbuf))
+        except OSError:
+            pass
+    return files
+
+
+def load_userexits(prefix, files=None):
+    '''Load text of userexit overrides
+
+    Args:
+        prefix = prefix for userexit file name
+        files = list of (path, stat result) from userexit_files(),
+            default is to look them up
+    Returns:
+        Catenation of all userexit file contents
+    '''
+    if files is None:
+        files = userexit_files(prefix)
+    code = ''
+    for (path, sbuf) in files:
+        try:
+            with open(path) as f:
+                code += f.read()
         except OSError:
             pass
     return code
 
+
+def compile_userexits(prefix, header=''):
+    '''Load and compile userexit overrides, reusing a cached compilation
+
+    Like __pycache__, the compiled code is saved (in the per-user cache
+    directory) and reused as long as the userexit files and the python
+    version are unchanged.
+
+    Args:
+        prefix = prefix for userexit file name
+        header = text to prepend to the userexit code
+    Returns:
+        code object to exec, or None if there is no userexit code
+    '''
+    files = userexit_files(prefix)
+    if not files:
+        return None
+    import importlib.util
+    stamp = (importlib.util.MAGIC_NUMBER, header,
+             [(path, sbuf.st_mtime_ns, sbuf.st_size, sbuf.st_uid)
+              for (path, sbuf) in files])
+    key = ('userexits', prefix, sys.implementation.cache_tag,
+           tuple(path for (path, sbuf) in files))
+    path = cache_path(key)
+    if path is not None:
+        (fd, sbuf) = cache_open(path)
+        if fd is not None:
+            try:
+                with os.fdopen(fd, 'rb') as f:
+                    (t, prog) = marshal.loads(f.read())
+                if t == stamp:
+                    return prog
+            except (OSError, ValueError, EOFError, TypeError):
+                pass
+    code = load_userexits(prefix, files)
+    if not code:
+        return None
+    prog = compile(header + code, 'userexit code', 'exec')
+    if not sys.dont_write_bytecode:
+        path = cache_path(key, True)
+        if path is not None:
+            cache_write(path, marshal.dumps((stamp, prog)))
+    return prog
+
 # Dummy userexit routines that can be overridden by user/system
 
 
@@ -328,6 +1405,225 @@ userexits_header = 'global %s\n' % ','.join(
     ]
 )
 
+# Routines for --debug profile
+
+gProfiler = None
+
+
+class Profiler(object):
+    '''Collect time, memory, and item counts for phases of a command
+
+    Each phase is timed by a context manager from profile_phase().
+    Phases that repeat (e.g., once per server) are summed. If memory
+    is traced, it is the peak traced by tracemalloc while the phase
+    ran. Tracing slows everything down, so it is off unless asked for,
+    and the times are then those of a normal run.
+    '''
+
+    def __init__(self, dest, mem=False):
+        self.tracemalloc = None
+        if mem:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            tracemalloc.start()
+        self.dest = dest
+        self.totals = dict()
+        self.active = []
+        self.peak = 0
+        self.start = time.perf_counter()
+
+    def traced(self):
+        '''Get current traced memory, 0 if not tracing'''
+        if self.tracemalloc is None:
+            return 0
+        return self.tracemalloc.get_traced_memory()[0]
+
+    def note_peak(self):
+        '''Credit the memory peak since the last check to active phases'''
+        if self.tracemalloc is None:
+            return
+        peak = self.tracemalloc.get_traced_memory()[1]
+        for ph in self.active:
+            if peak > ph.peak:
+                ph.peak = peak
+        if peak > self.peak:
+            self.peak = peak
+        self.tracemalloc.reset_peak()
+
+    def add(self, ph, secs):
+        '''Add the results of one run of a phase to its totals'''
+        tot = self.totals.get(ph.name)
+        if tot is None:
+            tot = self.totals[ph.name] = {'calls': 0, 'ms': 0.0, 'rows': 0,
+                                          'attrs': 0, 'peak_mb': 0.0}
+        tot['calls'] += 1
+        tot['ms'] += secs * 1000
+        tot['rows'] += ph.rows
+        tot['attrs'] += ph.attrs
+        tot['peak_mb'] = max(tot['peak_mb'], ph.peak / 1e6)
+
+    def report(self, prog, version):
+        '''Write the report to stderr or append it to a JSON-lines file
+
+        Args:
+            prog = name of command
+            version = command version
+        '''
+        total_ms = (time.perf_counter() - self.start) * 1000
+        self.note_peak()
+        peak = self.peak
+        if self.tracemalloc is not None:
+            self.tracemalloc.stop()
+        if self.dest is None:
+            # Show memory only if it was traced
+            mem = self.tracemalloc is not None
+
+            def show(text, peak_text):
+                print('profile: ' + (text + peak_text if mem else
+                                     text.rstrip()), file=sys.stderr)
+            show('%-16s %5s %9s %8s %9s' % ('phase', 'calls', 'time ms',
+                                            'rows', 'attrs'),
+                 ' %8s' % 'peak MB')
+            for (name, tot) in self.totals.items():
+                show('%-16s %5d %9.2f %8d %9d' % (name, tot['calls'],
+                                                  tot['ms'], tot['rows'],
+                                                  tot['attrs']),
+                     ' %8.2f' % tot['peak_mb'])
+            show('%-16s %5s %9.2f %8s %9s' % ('total', '', total_ms, '', ''),
+                 ' %8.2f' % (peak / 1e6))
+            return
+        import json
+        rec = {
+            'timestamp': int(conf.gNow or time.time()),
+            'command': prog,
+            'version': version,
+            'pbs_server': pbs_conf.pbs_server_name,
+            'argv': sys.argv[1:],
+            'total_ms': round(total_ms, 3),
+            'peak_mb': round(peak / 1e6, 3),
+            'mem_traced': self.tracemalloc is not None,
+            'phases': self.totals,
+        }
+        for tot in self.totals.values():
+            tot['ms'] = round(tot['ms'], 3)
+            tot['peak_mb'] = round(tot['peak_mb'], 3)
+        line = json.dumps(rec) + '\n'
+        if self.dest == 'json':
+            sys.stderr.write(line)
+            return
+        try:
+            with open(self.dest, 'a') as f:
+                f.write(line)
+        except OSError as e:
+            print('Cannot write profile to %s: %s' % (self.dest, e),
+                  file=sys.stderr)
+
+
+class ProfilePhase(object):
+    '''Context manager timing one run of a phase'''
+    __slots__ = ('prof', 'name', 'start', 'peak', 'rows', 'attrs')
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+        self.peak = 0
+        self.rows = 0
+        self.attrs = 0
+
+    def __enter__(self):
+        self.prof.note_peak()
+        self.peak = self.prof.traced()
+        self.prof.active.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        secs = time.perf_counter() - self.start
+        self.prof.note_peak()
+        self.prof.active.remove(self)
+        self.prof.add(self, secs)
+        return False
+
+    def count(self, items, attrs=True):
+        '''Count the items (e.g., jobs or rows) handled by the phase
+
+        Args:
+            items = list of items
+            attrs = True if the items are dicts or lists, and the
+                total of their lengths should be counted as attrs
+        '''
+        if items:
+            self.rows += len(items)
+            if attrs:
+                self.attrs += sum(len(x) for x in items)
+
+
+class NullPhase(object):
+    '''Stand-in for ProfilePhase when not profiling'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, items, attrs=True):
+        pass
+
+
+null_phase = NullPhase()
+
+
+def profile_start(dest=None, mem=False):
+    '''Start profiling phases, for --debug profile
+
+    Args:
+        dest = None for a table on stderr, 'json' for a JSON line on
+            stderr, else path of a file to append a JSON line to
+        mem = True to also trace memory use (--debug profile_mem)
+    '''
+    global gProfiler
+    gProfiler = Profiler(dest, mem)
+
+
+def profile_phase(name):
+    '''Get a context manager that profiles a phase
+
+    Usage:
+        with profile_phase('statjob') as ph:
+            bs = ...
+            ph.count(bs)
+
+    Only the main thread is profiled. Work done in other threads (e.g.,
+    the concurrent queries of -W fanout) overlaps the main thread's
+    phases, which already include the time spent waiting for it, so
+    timing it too would count it twice.
+
+    Args:
+        name = name of phase
+    Returns:
+        context manager, which does nothing if not profiling
+    '''
+    if gProfiler is None or \
+            threading.current_thread() is not threading.main_thread():
+        return null_phase
+    return ProfilePhase(gProfiler, name)
+
+
+def profile_report(prog, version):
+    '''Report and stop profiling, if --debug profile is active
+
+    Args:
+        prog = name of command
+        version = command version
+    '''
+    global gProfiler
+    if gProfiler is not None:
+        gProfiler.report(prog, version)
+        gProfiler = None
+
+
 # Routines dealing with -f output
 
 
@@ -379,28 +1675,95 @@ def info_to_file(fd, info, item_tag):
         info = list of batch status data to display
         item_tag = tag for each item in -f output
     '''
+    write_chunks(fd, info_f_text(info, item_tag))
+    return 0
+
+
+def info_f_text(info, item_tag):
+    '''Generate the -f format text for batch status data, item by item
+
+    Args:
+        info = list of batch status data to display
+        item_tag = tag for each item in -f output
+    Returns:
+        iterator over the text for each item
+    '''
+    hfmt = '%a %b %d %X %Z %Y'
+    htimes = dict()
     for item in info:
         item_name = item.get('id')
         if not item_name:
             continue
-        rows = []
         if item_tag:
-            rows.append("%s: %s" % (item_tag, item_name))
+            hdr = "%s: %s\n" % (item_tag, item_name)
         else:
-            rows.append(item_name)
-        for key in filter(lambda x: x not in ignore_attrs, item.keys()):
-            attr = item[key]
-            if isinstance(attr, str) and '\n' in attr:
-                attr = attr.replace('\n', r'\n')
-            row = "    %s = %s" % (key, attr)
-            if key in time_attrs:
-                t = time.strftime('%a %b %d %X %Z %Y',
-                                  time.localtime(int(attr)))
-                row += ' (' + t + ')'
-            rows.append(row)
-        print('\n'.join(rows), file=fd)
-        print(file=fd)
-    return 0
+            hdr = '%s\n' % item_name
+        # Fill in human readable times, then format all the rows at
+        # once. Values containing newlines are rare; if there are any,
+        # start over a row at a time.
+        d = item
+        tkeys = time_attrs.intersection(item)
+        if tkeys:
+            d = dict(item)
+            for key in tkeys:
+                attr = d[key]
+                try:
+                    t = htimes[attr]
+                except KeyError:
+                    t = htimes[attr] = ' (' + \
+                        epoch_strftime(hfmt, int(attr)) + ')'
+                d[key] = '%s%s' % (attr, t)
+        rows = ['    %s = %s' % (key, attr) for (key, attr) in d.items()
+                if key not in ignore_attrs]
+        body = '\n'.join(rows)
+        if body.count('\n') >= len(rows):
+            rows = []
+            for (key, attr) in item.items():
+                if key in ignore_attrs:
+                    continue
+                if isinstance(attr, str) and '\n' in attr:
+                    attr = attr.replace('\n', r'\n')
+                row = "    %s = %s" % (key, attr)
+                if key in time_attrs:
+                    row += htimes[item[key]]
+                rows.append(row)
+            body = '\n'.join(rows)
+        yield hdr + body + '\n\n' if rows else hdr + '\n'
+
+
+def write_chunks(fd, pieces, size=1 << 16):
+    '''Write pieces of text to a file in large chunks
+
+    If fd is a text file with an underlying binary buffer (e.g.,
+    sys.stdout), the chunks are encoded and written directly to the
+    buffer, bypassing the text layer.
+
+    Args:
+        fd = Open file object to write to
+        pieces = iterable of strings
+        size = approximate number of characters per write
+    '''
+    buf = getattr(fd, 'buffer', None)
+    if buf is None:
+        write = fd.write
+    else:
+        fd.flush()
+        encoding = fd.encoding
+        errors = fd.errors or 'strict'
+
+        def write(s):
+            buf.write(s.encode(encoding, errors))
+    chunk = []
+    n = 0
+    for piece in pieces:
+        chunk.append(piece)
+        n += len(piece)
+        if n >= size:
+            write(''.join(chunk))
+            chunk = []
+            n = 0
+    if chunk:
+        write(''.join(chunk))
 
 
 gEncoder = None
@@ -410,8 +1773,9 @@ def bs_to_json(info, tag, timestamp=None, version=None, server=None):
     '''
     Convert a PBS batch status list to json.
     Insert a prefix along the way to mimic qstat.
-    We convert and print one item at a time to handle large numbers of items
-    without having to gather them all into one gigantic output.
+    We convert one item at a time and write the results in large chunks
+    to handle large numbers of items without having to gather them all
+    into one gigantic output.
 
     Args:
         info = bs list
@@ -432,21 +1796,25 @@ def bs_to_json(info, tag, timestamp=None, version=None, server=None):
     if server is None:
         server = pbs_conf.pbs_server_name
     # Construct the prefix
-    print("""{
+    pfx = """{
     "timestamp":%d,
     "pbs_version":"%s",
     "pbs_server":"%s",
-    "%s":{""" % (timestamp, version, server, tag))
-    # Convert each item to JSON and output
-    firsttime = True
-    for item in info:
-        if not firsttime:
-            print(',')
-        firsttime = False
-        print(bs_item_to_json(item, 2), end='')
-    print("""
+    "%s":{
+""" % (timestamp, version, server, tag)
+
+    def pieces():
+        yield pfx
+        sep = ''
+        for item in info:
+            yield sep
+            sep = ',\n'
+            yield '%s' % bs_item_to_json(item, 2)
+        yield """
     }
-}""")
+}
+"""
+    write_chunks(sys.stdout, pieces())
     return True
 
 
@@ -459,6 +1827,8 @@ def bs_item_to_json(bs, lvl):
     Also, resource lists get returned as multiple entries with keys of the form
     "attribute_name.resource_name". We need to merge those back to lists
     of the resources for a give attribute.
+    The text is laid out as json.JSONEncoder(indent=4) would lay it out,
+    indented lvl levels.
 
     Args:
         bs = item from a batch status
@@ -466,19 +1836,17 @@ def bs_item_to_json(bs, lvl):
     Returns: Item as JSON text,
              None on error.
     '''
-    global gEncoder
+    global json_str
     if not bs:
         return None
-    if gEncoder is None:
-        gEncoder = json.JSONEncoder(check_circular=False, indent=4,
-                                    separators=(',', ':')).encode
     item_name = bs.get('id', None)
     if item_name is None:
         return None
+    if json_str is None:
+        from json.encoder import encode_basestring_ascii as json_str
     cur_attrname = None
     cur_resclist = {}
     json_data = {}
-    pfx = '    ' * lvl
     for (key, value) in bs.items():
         if key == 'id':
             continue
@@ -486,10 +1854,7 @@ def bs_item_to_json(bs, lvl):
             t = int(value)
             if str(t) == value:
                 value = t
-        if '.' in key:
-            (attr, resc) = key.split('.', 1)
-        else:
-            (attr, resc) = (key, None)
+        (attr, dot, resc) = key.partition('.')
         # See if we reached the end of a resource list
         if cur_attrname and cur_attrname != attr:
             json_data[cur_attrname] = cur_resclist
@@ -509,8 +1874,49 @@ def bs_item_to_json(bs, lvl):
     # Handle falling off the end of a resource list
     if cur_attrname:
         json_data[cur_attrname] = cur_resclist
-    t = '%s"%s":' % (pfx, item_name) + gEncoder(json_data)
-    return ('\n' + pfx).join(t.split('\n'))
+    pfx = '    ' * lvl
+    return '%s"%s":' % (pfx, item_name) + json_dict_text(json_data, pfx)
+
+
+def json_dict_text(d, pfx):
+    '''Convert a dict of attribute values to indented JSON text
+
+    Args:
+        d = dict to convert, values are str, int, or dicts of those
+        pfx = indentation of the line containing the opening brace
+    Returns:
+        text as json.JSONEncoder(indent=4, separators=(',', ':')) would
+        produce, with pfx added after each newline
+    '''
+    if not d:
+        return '{}'
+    ipfx = pfx + '    '
+    rows = []
+    for (key, value) in d.items():
+        if isinstance(value, str):
+            t = json_str(value)
+        elif type(value) is int:
+            t = int.__repr__(value)
+        elif isinstance(value, dict):
+            t = json_dict_text(value, ipfx)
+        else:
+            t = json_other(value).replace('\n', '\n' + ipfx)
+        rows.append(ipfx + json_str(key) + ':' + t)
+    return '{\n' + ',\n'.join(rows) + '\n' + pfx + '}'
+
+
+def json_other(value):
+    '''Convert any other value to JSON text, as bs_item_to_json() would'''
+    global gEncoder
+    if gEncoder is None:
+        import json
+        gEncoder = json.JSONEncoder(check_circular=False, indent=4,
+                                    separators=(',', ':')).encode
+    return gEncoder(value)
+
+
+# Set by bs_item_to_json() on first use
+json_str = None
 
 
 # Utility functions copied from PTL's BatchUtils class
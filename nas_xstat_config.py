@@ -1,6 +1,8 @@
 ''' Configuration globals for nas_qstat or nas_rstat
 '''
 args = None
+attr_resources = False		# Ask for resources, not whole attributes
+cache_ttl = 0			# Seconds to reuse cached PBS status
 gNAS = False			# Set run when running for NAS
 gNow = None			# The current time
 gdebug = ''			# Debugging options string
@@ -9,4 +11,8 @@ ghostnameshort = ''		# Short hostname
 host_re = None			# Hostname pattern
 opts_W = list()			# -W options, as list
 pbs_conf = None			# pbs config options
+qstatd_max_age = 60		# Ignore nas_qstatd data older than this
+qstatd_socket = None		# nas_qstatd socket path, None for default
+qstatd_timeout = 10		# Seconds to wait for nas_qstatd
+qstatd_user = None		# Also trust nas_qstatd sockets owned by this user
 verbose = 0			# Verbosity flag
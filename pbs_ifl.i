@@ -98,6 +98,21 @@
 #include "my_pbsconf.h"
 %}
 
+/*
+ * With swig -threads, the GIL is released around every wrapped call, so
+ * queries to several servers can be in progress at once.  Functions that
+ * build Python objects must hold the GIL, so they release it themselves
+ * just around the IFL call.
+ */
+%nothread pbs_statjob_columns;
+%nothread pbs_selstat_columns;
+%nothread pbs_statjob_lazy;
+%nothread pbs_selstat_lazy;
+%nothread lazy_bs_count;
+%nothread lazy_bs_name;
+%nothread lazy_bs_get;
+%nothread lazy_bs_keys;
+
 /* functions to acquire values from thread specific variables */
 %inline
 %{
@@ -117,6 +132,442 @@ const char * get_pbs_version(void)
 }
 %}
 
+/*
+ * Columnar versions of pbs_statjob() and pbs_selstat().
+ *
+ * Rather than one dict per object, these return a tuple (ids, columns)
+ * where ids is a list of object names and columns is a dict mapping each
+ * attribute name (attr or attr.resource) to a list with one value per
+ * object (None where the object lacks the attribute).
+ * Attribute-name keys are built once per call and low-cardinality values
+ * (job_state, queue, etc.) are shared between objects.
+ */
+%{
+/* Attributes whose values repeat heavily from job to job */
+static const char *low_card_attrs[] = {
+    "job_state", "queue", "euser", "egroup", "substate", "server", NULL
+};
+
+struct colslot {
+    const char *name;
+    const char *resource;
+    PyObject *col;          /* borrowed from the columns dict */
+    int lowcard;
+};
+
+static int
+same_str(const char *a, const char *b)
+{
+    if (a == NULL || b == NULL)
+        return a == b;
+    return strcmp(a, b) == 0;
+}
+
+static int
+is_low_card(const char *name, const char *resource)
+{
+    int i;
+
+    if (resource != NULL)
+        return 0;
+    for (i = 0; low_card_attrs[i]; i++)
+        if (strcmp(name, low_card_attrs[i]) == 0)
+            return 1;
+    return 0;
+}
+
+static PyObject *
+bs_to_columns(struct batch_status *head)
+{
+    struct batch_status *bs;
+    struct attrl *pat;
+    struct colslot *slots = NULL;
+    int nslots = 0;
+    int j;
+    Py_ssize_t len, i, k;
+    PyObject *ids = NULL;
+    PyObject *cols = NULL;
+    PyObject *vals = NULL;
+    PyObject *result = NULL;
+
+    for (len = 0, bs = head; bs != NULL; bs = bs->next)
+        len++;
+    ids = PyList_New(len);
+    cols = PyDict_New();
+    vals = PyDict_New();
+    if (ids == NULL || cols == NULL || vals == NULL)
+        goto done;
+    for (i = 0, bs = head; bs != NULL; i++, bs = bs->next) {
+        PyObject *v = PyUnicode_FromString(bs->name);
+        if (v == NULL)
+            goto done;
+        PyList_SET_ITEM(ids, i, v);
+        for (j = 0, pat = bs->attribs; pat != NULL; j++, pat = pat->next) {
+            PyObject *col, *old, *val;
+            int lowcard;
+
+            /* Objects usually list attributes in the same order, so
+             * first try the column found at this position last time.
+             */
+            if (j < nslots && same_str(slots[j].name, pat->name) &&
+                same_str(slots[j].resource, pat->resource)) {
+                col = slots[j].col;
+                lowcard = slots[j].lowcard;
+            } else {
+                PyObject *key;
+                if (pat->resource != NULL)
+                    key = PyUnicode_FromFormat("%s.%s", pat->name,
+                                               pat->resource);
+                else
+                    key = PyUnicode_FromString(pat->name);
+                if (key == NULL)
+                    goto done;
+                PyUnicode_InternInPlace(&key);
+                col = PyDict_GetItemWithError(cols, key);
+                if (col == NULL) {
+                    if (PyErr_Occurred()) {
+                        Py_DECREF(key);
+                        goto done;
+                    }
+                    col = PyList_New(len);
+                    if (col == NULL) {
+                        Py_DECREF(key);
+                        goto done;
+                    }
+                    for (k = 0; k < len; k++) {
+                        Py_INCREF(Py_None);
+                        PyList_SET_ITEM(col, k, Py_None);
+                    }
+                    if (PyDict_SetItem(cols, key, col) < 0) {
+                        Py_DECREF(col);
+                        Py_DECREF(key);
+                        goto done;
+                    }
+                    Py_DECREF(col);
+                }
+                Py_DECREF(key);
+                lowcard = is_low_card(pat->name, pat->resource);
+                if (j >= nslots) {
+                    struct colslot *t;
+                    t = realloc(slots, (j + 16) * sizeof(*slots));
+                    if (t == NULL) {
+                        PyErr_NoMemory();
+                        goto done;
+                    }
+                    slots = t;
+                    nslots = j + 16;
+                    for (k = j; k < nslots; k++)
+                        slots[k].name = NULL;
+                }
+                slots[j].name = pat->name;
+                slots[j].resource = pat->resource;
+                slots[j].col = col;
+                slots[j].lowcard = lowcard;
+            }
+            old = PyList_GET_ITEM(col, i);
+            if (old != Py_None) {
+                /* Repeated attribute, join values as the dict form does */
+                val = PyUnicode_FromFormat("%s,%U", pat->value, old);
+            } else if (lowcard) {
+                PyObject *t = PyUnicode_FromString(pat->value);
+                if (t == NULL)
+                    goto done;
+                val = PyDict_SetDefault(vals, t, t);
+                Py_XINCREF(val);
+                Py_DECREF(t);
+            } else {
+                val = PyUnicode_FromString(pat->value);
+            }
+            if (val == NULL)
+                goto done;
+            PyList_SetItem(col, i, val);
+        }
+    }
+    result = PyTuple_Pack(2, ids, cols);
+done:
+    free(slots);
+    Py_XDECREF(ids);
+    Py_XDECREF(cols);
+    Py_XDECREF(vals);
+    return result;
+}
+%}
+
+%inline
+%{
+PyObject *pbs_statjob_columns(int c, char *id, struct attrl *attrib,
+    char *extend)
+{
+    struct batch_status *bs;
+    PyObject *result;
+
+    Py_BEGIN_ALLOW_THREADS
+    bs = pbs_statjob(c, id, attrib, extend);
+    Py_END_ALLOW_THREADS
+    result = bs_to_columns(bs);
+    pbs_statfree(bs);
+    return result;
+}
+
+PyObject *pbs_selstat_columns(int c, struct attropl *select,
+    struct attrl *attrib, char *extend)
+{
+    struct batch_status *bs;
+    PyObject *result;
+
+    Py_BEGIN_ALLOW_THREADS
+    bs = pbs_selstat(c, select, attrib, extend);
+    Py_END_ALLOW_THREADS
+    result = bs_to_columns(bs);
+    pbs_statfree(bs);
+    return result;
+}
+%}
+
+/*
+ * Lazy versions of pbs_statjob() and pbs_selstat().
+ *
+ * These return an opaque capsule that keeps the C batch_status chain.
+ * Nothing is converted to Python objects until asked for with
+ * lazy_bs_name(), lazy_bs_get() or lazy_bs_keys(). The chain is freed
+ * with pbs_statfree() when the capsule is garbage collected.
+ */
+%{
+#define LAZY_BS_NAME "pbs_ifl.lazy_bs"
+
+struct lazy_bs {
+    struct batch_status *head;
+    Py_ssize_t count;
+    struct batch_status **objs;
+    struct attrl ***index;  /* per-object attrl pointers, built on demand */
+    int *nattr;
+};
+
+static void
+lazy_bs_free(PyObject *cap)
+{
+    struct lazy_bs *lb;
+    Py_ssize_t i;
+
+    lb = PyCapsule_GetPointer(cap, LAZY_BS_NAME);
+    if (lb == NULL)
+        return;
+    if (lb->index) {
+        for (i = 0; i < lb->count; i++)
+            free(lb->index[i]);
+        free(lb->index);
+    }
+    free(lb->nattr);
+    free(lb->objs);
+    pbs_statfree(lb->head);
+    free(lb);
+}
+
+static PyObject *
+lazy_bs_new(struct batch_status *head)
+{
+    struct lazy_bs *lb;
+    struct batch_status *bs;
+    PyObject *cap;
+    Py_ssize_t i;
+
+    lb = calloc(1, sizeof(*lb));
+    if (lb == NULL)
+        goto nomem;
+    lb->head = head;
+    for (bs = head; bs != NULL; bs = bs->next)
+        lb->count++;
+    if (lb->count > 0) {
+        lb->objs = malloc(lb->count * sizeof(*lb->objs));
+        lb->index = calloc(lb->count, sizeof(*lb->index));
+        lb->nattr = calloc(lb->count, sizeof(*lb->nattr));
+        if (lb->objs == NULL || lb->index == NULL || lb->nattr == NULL)
+            goto nomem;
+        for (i = 0, bs = head; bs != NULL; i++, bs = bs->next)
+            lb->objs[i] = bs;
+    }
+    cap = PyCapsule_New(lb, LAZY_BS_NAME, lazy_bs_free);
+    if (cap == NULL) {
+        free(lb->nattr);
+        free(lb->index);
+        free(lb->objs);
+        free(lb);
+        pbs_statfree(head);
+    }
+    return cap;
+nomem:
+    if (lb) {
+        free(lb->nattr);
+        free(lb->index);
+        free(lb->objs);
+        free(lb);
+    }
+    pbs_statfree(head);
+    return PyErr_NoMemory();
+}
+
+/* Look up object i, building its attribute index on first use */
+static struct lazy_bs *
+lazy_bs_obj(PyObject *cap, int i)
+{
+    struct lazy_bs *lb;
+    struct attrl *pat;
+    int n;
+
+    lb = PyCapsule_GetPointer(cap, LAZY_BS_NAME);
+    if (lb == NULL)
+        return NULL;
+    if (i < 0 || i >= lb->count) {
+        PyErr_SetString(PyExc_IndexError, "batch_status index out of range");
+        return NULL;
+    }
+    if (lb->index[i] == NULL) {
+        for (n = 0, pat = lb->objs[i]->attribs; pat; pat = pat->next)
+            n++;
+        lb->index[i] = malloc((n + 1) * sizeof(struct attrl *));
+        if (lb->index[i] == NULL) {
+            PyErr_NoMemory();
+            return NULL;
+        }
+        for (n = 0, pat = lb->objs[i]->attribs; pat; pat = pat->next)
+            lb->index[i][n++] = pat;
+        lb->nattr[i] = n;
+    }
+    return lb;
+}
+
+static PyObject *
+lazy_attr_key(struct attrl *pat)
+{
+    if (pat->resource != NULL)
+        return PyUnicode_FromFormat("%s.%s", pat->name, pat->resource);
+    return PyUnicode_FromString(pat->name);
+}
+%}
+
+%inline
+%{
+PyObject *pbs_statjob_lazy(int c, char *id, struct attrl *attrib,
+    char *extend)
+{
+    struct batch_status *bs;
+
+    Py_BEGIN_ALLOW_THREADS
+    bs = pbs_statjob(c, id, attrib, extend);
+    Py_END_ALLOW_THREADS
+    return lazy_bs_new(bs);
+}
+
+PyObject *pbs_selstat_lazy(int c, struct attropl *select,
+    struct attrl *attrib, char *extend)
+{
+    struct batch_status *bs;
+
+    Py_BEGIN_ALLOW_THREADS
+    bs = pbs_selstat(c, select, attrib, extend);
+    Py_END_ALLOW_THREADS
+    return lazy_bs_new(bs);
+}
+
+/* Number of objects in a lazy batch status */
+PyObject *lazy_bs_count(PyObject *cap)
+{
+    struct lazy_bs *lb;
+
+    lb = PyCapsule_GetPointer(cap, LAZY_BS_NAME);
+    if (lb == NULL)
+        return NULL;
+    return PyLong_FromSsize_t(lb->count);
+}
+
+/* Name (id) of object i */
+PyObject *lazy_bs_name(PyObject *cap, int i)
+{
+    struct lazy_bs *lb;
+
+    lb = PyCapsule_GetPointer(cap, LAZY_BS_NAME);
+    if (lb == NULL)
+        return NULL;
+    if (i < 0 || i >= lb->count) {
+        PyErr_SetString(PyExc_IndexError, "batch_status index out of range");
+        return NULL;
+    }
+    return PyUnicode_FromString(lb->objs[i]->name);
+}
+
+/*
+ * Value of attribute key ("attr" or "attr.resource") for object i,
+ * or None if absent. Repeated attributes are joined newest first,
+ * as the batch_status typemap does.
+ */
+PyObject *lazy_bs_get(PyObject *cap, int i, char *key)
+{
+    struct lazy_bs *lb;
+    struct attrl **idx;
+    struct attrl *pat;
+    const char *rsc;
+    size_t nlen;
+    int j;
+    PyObject *result = NULL;
+
+    lb = lazy_bs_obj(cap, i);
+    if (lb == NULL)
+        return NULL;
+    rsc = strchr(key, '.');
+    nlen = rsc ? (size_t)(rsc - key) : strlen(key);
+    if (rsc)
+        rsc++;
+    idx = lb->index[i];
+    for (j = 0; j < lb->nattr[i]; j++) {
+        pat = idx[j];
+        if (strncmp(pat->name, key, nlen) != 0 || pat->name[nlen] != '\0')
+            continue;
+        if (rsc ? (pat->resource == NULL || strcmp(pat->resource, rsc))
+                : pat->resource != NULL)
+            continue;
+        if (result == NULL) {
+            result = PyUnicode_FromString(pat->value);
+        } else {
+            PyObject *t = PyUnicode_FromFormat("%s,%U", pat->value, result);
+            Py_DECREF(result);
+            result = t;
+        }
+        if (result == NULL)
+            return NULL;
+    }
+    if (result == NULL)
+        Py_RETURN_NONE;
+    return result;
+}
+
+/* Attribute keys of object i, in order of first appearance */
+PyObject *lazy_bs_keys(PyObject *cap, int i)
+{
+    struct lazy_bs *lb;
+    PyObject *seen, *result;
+    int j;
+
+    lb = lazy_bs_obj(cap, i);
+    if (lb == NULL)
+        return NULL;
+    seen = PyDict_New();
+    if (seen == NULL)
+        return NULL;
+    for (j = 0; j < lb->nattr[i]; j++) {
+        PyObject *key = lazy_attr_key(lb->index[i][j]);
+        if (key == NULL || PyDict_SetDefault(seen, key, Py_None) == NULL) {
+            Py_XDECREF(key);
+            Py_DECREF(seen);
+            return NULL;
+        }
+        Py_DECREF(key);
+    }
+    result = PyDict_Keys(seen);
+    Py_DECREF(seen);
+    return result;
+}
+%}
+
 %include "pbs_ifl.h"
 %include "pbs_error.h"
 %include "my_pbsconf.h"